@@ -0,0 +1,72 @@
+"""Import-time budget for the package.
+
+Imports each module in a fresh interpreter (best of --runs) and fails when `import retrac`
+exceeds --budget-s. Importing the package must stay cheap: tools, SDK clients and .env
+loading are deferred until used. --top lists the slowest imports from `-X importtime`.
+
+    python benchmarks/bench_import.py --budget-s 0.5 --top 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY = ("openai", "aiohttp", "httpx", "langchain_openai", "dotenv", "yaml", "retrac.tools")
+
+
+def import_time(module: str) -> Tuple[float, List[Tuple[int, str]]]:
+    """Cumulative import time of module in seconds, and per-module (cumulative us, name) rows"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    total = next((us for us, name in reversed(rows) if name == module), 0)
+    return total / 1e6, rows
+
+
+def loaded_heavy_modules(module: str) -> List[str]:
+    code = f"import sys, {module}; print(' '.join(m for m in {HEAVY!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    if proc.stderr.strip() or len(proc.stdout.splitlines()) > 1:
+        print(f"import {module} wrote output:\n{proc.stdout}{proc.stderr}")
+    lines = proc.stdout.splitlines()
+    return lines[-1].split() if lines else []
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-s", type=float, default=0.5, help="max seconds for `import retrac`")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="show the N slowest imports")
+    parser.add_argument("--modules", nargs="+", default=["retrac", "retrac.graph"])
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        results = [import_time(module) for _ in range(args.runs)]
+        best, rows = min(results, key=lambda r: r[0])
+        heavy = loaded_heavy_modules(module)
+        print(f"import {module}: {best:.3f}s (best of {args.runs})" + (f", loads {', '.join(heavy)}" if heavy else ""))
+        for us, name in sorted(rows, reverse=True)[1:args.top + 1]:
+            print(f"    {us / 1e3:8.1f} ms  {name}")
+        if module == "retrac":
+            if best > args.budget_s:
+                print(f"FAIL: import retrac took {best:.3f}s, budget {args.budget_s:.3f}s")
+                failed = True
+            if heavy:
+                print(f"FAIL: import retrac loads {', '.join(heavy)}")
+                failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Micro-benchmark of per-turn message bookkeeping in a long rollout.
+
+Compares the previous full-history pattern (copy the list in the llm node and in
+tools_merge, rescan for ToolMessages in decide, type-check every message per request)
+with the append-only reducer and running counters used by the graph now.
+
+    python benchmarks/bench_message_state.py --turns 200 500 1000
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from retrac.graph import append_messages
+
+
+def _turn(i: int, tools_per_turn: int) -> tuple:
+    call_ids = [f"call_{i}_{j}" for j in range(tools_per_turn)]
+    ai = AIMessage(content="", tool_calls=[{"name": "search", "args": {"query": ["q"]}, "id": c} for c in call_ids])
+    tools = [ToolMessage(content="x" * 2000, tool_call_id=c) for c in call_ids]
+    return ai, tools
+
+
+def full_history(turns: List[tuple]) -> float:
+    messages: List[BaseMessage] = [SystemMessage(content="s"), HumanMessage(content="q")]
+    start = time.perf_counter()
+    for ai, tools in turns:
+        if any(not isinstance(m, BaseMessage) for m in messages):
+            raise TypeError
+        messages = messages + [ai]
+        _ = sum([1 if isinstance(m, ToolMessage) else 0 for m in messages])
+        messages = list(messages) + list(tools)
+    return time.perf_counter() - start
+
+
+def append_only(turns: List[tuple]) -> float:
+    messages: List[BaseMessage] = append_messages([], [SystemMessage(content="s"), HumanMessage(content="q")])
+    tool_calls_num = 0
+    start = time.perf_counter()
+    for ai, tools in turns:
+        messages = append_messages(messages, [ai])
+        messages = append_messages(messages, tools)
+        tool_calls_num += len(tools)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[100, 300, 1000])
+    parser.add_argument("--tools-per-turn", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'turns':>6} {'messages':>9} {'full history (ms)':>18} {'append-only (ms)':>17} {'speedup':>8}")
+    for n_turns in args.turns:
+        turns = [_turn(i, args.tools_per_turn) for i in range(n_turns)]
+        old = min(full_history(turns) for _ in range(args.repeat))
+        new = min(append_only(turns) for _ in range(args.repeat))
+        n = 2 + n_turns * (1 + args.tools_per_turn)
+        print(f"{n_turns:>6} {n:>9} {old * 1e3:>18.2f} {new * 1e3:>17.2f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
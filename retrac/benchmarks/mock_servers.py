@@ -0,0 +1,183 @@
+"""Offline stand-ins for the LLM endpoint and the tool server, for benchmarks.
+
+One aiohttp app serves both:
+  /v1/chat/completions  OpenAI-compatible, scripted: each rollout alternates search and visit
+                        tool calls for --turns turns, then answers; summary requests get a
+                        structured "0) Current Answer" summary. Supports stream=true (SSE).
+  /search, /visit       the TOOL_SERVER_URL protocol, with synthetic results and page sizes
+  /stats                request counters
+
+Latency is simulated as prefill (per prompt token) plus decode (per output token).
+
+    python benchmarks/mock_servers.py --port 8901 --turns 8 --page-bytes 20000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+SUMMARY_MARKER = "Summary the trajectory"
+
+
+@dataclass
+class MockConfig:
+    turns: int = 4
+    search_items: int = 10
+    page_bytes: int = 20000
+    output_tokens: int = 64
+    prefill_s_per_1k_tokens: float = 0.002
+    decode_s_per_token: float = 0.0005
+    tool_latency_s: float = 0.01
+    seed: int = 0
+
+
+def _prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    chars = 0
+    for m in messages:
+        content = m.get("content") or ""
+        chars += len(content) if isinstance(content, str) else len(json.dumps(content))
+        chars += len(json.dumps(m.get("tool_calls") or ""))
+    return chars // 4 + 4 * len(messages)
+
+
+def _script(messages: List[Dict[str, Any]], cfg: MockConfig) -> Dict[str, Any]:
+    """Next assistant turn: a tool call, a final answer, or a cycle summary"""
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=0)
+    if SUMMARY_MARKER in str(messages[last_user].get("content", "")):
+        return {"content": (
+            "0) Current Answer\n  - Paris\n1) Facts & Evidence Collected\n  - Paris is the capital. "
+            "[Source: visit | https://example.com/0 | Verified: yes]\n2) Analysis & Conclusions\n  - See (1).\n"
+            "3) Source Inventory & Verification Status\n  - example.com: verified\n"
+            "4) Uncertainties, Limitations, Gaps\n  - None\n"
+        )}
+    turn = sum(1 for m in messages[last_user:] if m.get("role") == "assistant" and m.get("tool_calls"))
+    if turn >= cfg.turns:
+        return {"content": "The answer is Paris."}
+    # distinct per question and turn so the tool cache and single-flight do not collapse work
+    tag = hashlib.sha256(str(messages[last_user].get("content", "")).encode()).hexdigest()[:8]
+    if turn % 2 == 0:
+        name, args = "search", {"query": [f"q-{tag}-{turn}-{i}" for i in range(2)]}
+    else:
+        name, args = "visit", {"url": [f"https://example.com/{tag}/{turn}"], "goal": "find the capital"}
+    return {"content": "", "tool_calls": [{
+        "id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+        "function": {"name": name, "arguments": json.dumps(args)},
+    }]}
+
+
+class MockServers:
+    def __init__(self, cfg: MockConfig) -> None:
+        self.cfg = cfg
+        self.stats: Counter = Counter()
+        self.rng = random.Random(cfg.seed)
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        messages = body.get("messages", [])
+        reply = _script(messages, self.cfg)
+        prompt_tokens = _prompt_tokens(messages)
+        completion_tokens = self.cfg.output_tokens
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        finish_reason = "tool_calls" if reply.get("tool_calls") else "stop"
+        self.stats["llm_requests"] += 1
+        self.stats["llm_prompt_tokens"] += prompt_tokens
+        created = int(time.time())
+        rid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        await asyncio.sleep(prompt_tokens / 1000 * self.cfg.prefill_s_per_1k_tokens)
+        if not body.get("stream"):
+            await asyncio.sleep(completion_tokens * self.cfg.decode_s_per_token)
+            return web.json_response({
+                "id": rid, "object": "chat.completion", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", **reply}, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(delta: Dict[str, Any], finish: str | None = None, with_usage: bool = False) -> None:
+            chunk = {
+                "id": rid, "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+                "choices": [] if with_usage else [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            if with_usage:
+                chunk["usage"] = usage
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        await send({"role": "assistant", "content": ""})
+        pieces = 8
+        content = reply.get("content", "")
+        step = max(1, len(content) // pieces)
+        for i in range(0, len(content), step):
+            await asyncio.sleep(completion_tokens / pieces * self.cfg.decode_s_per_token)
+            await send({"content": content[i:i + step]})
+        for index, call in enumerate(reply.get("tool_calls") or []):
+            await asyncio.sleep(completion_tokens / 2 * self.cfg.decode_s_per_token)
+            await send({"tool_calls": [{"index": index, "id": call["id"], "type": "function", "function": {"name": call["function"]["name"], "arguments": ""}}]})
+            await send({"tool_calls": [{"index": index, "function": {"arguments": call["function"]["arguments"]}}]})
+        await send({}, finish=finish_reason)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send({}, with_usage=True)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def search(self, request: web.Request) -> web.Response:
+        query = (await request.json()).get("query", "")
+        self.stats["search_requests"] += 1
+        await asyncio.sleep(self.cfg.tool_latency_s)
+        items = [
+            {"title": f"Result {i} for {query}", "link": f"https://example.com/{query}/{i}", "snippet": "lorem ipsum " * 20}
+            for i in range(self.cfg.search_items)
+        ]
+        return web.json_response({"items": items})
+
+    async def visit(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        urls = payload.get("urls", [])
+        self.stats["visit_requests"] += 1
+        await asyncio.sleep(self.cfg.tool_latency_s)
+        page = "".join(self.rng.choice("abcdefghij klmnop") for _ in range(min(self.cfg.page_bytes, 4096)))
+        page = (page * (self.cfg.page_bytes // max(len(page), 1) + 1))[:self.cfg.page_bytes]
+        self.stats["visit_bytes"] += len(page) * len(urls)
+        pages = "\n".join(page for _ in urls)
+        return web.json_response({"semanticDocument": f"The useful information in {urls} for user goal {payload.get('goal')} as follows: {pages}"})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"ok": True})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/v1/chat/completions", self.chat)
+        app.router.add_post("/search", self.search)
+        app.router.add_post("/visit", self.visit)
+        app.router.add_get("/stats", self.get_stats)
+        app.router.add_get("/health", self.health)
+        return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    for field, default in MockConfig.__dataclass_fields__.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default.default), default=default.default)
+    args = parser.parse_args()
+    cfg = MockConfig(**{f: getattr(args, f) for f in MockConfig.__dataclass_fields__})
+    web.run_app(MockServers(cfg).app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
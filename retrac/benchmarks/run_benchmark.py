@@ -0,0 +1,216 @@
+"""End-to-end offline benchmark of the agent loop against mock LLM and tool servers.
+
+Each scenario starts benchmarks/mock_servers.py on a free port and runs the real graph
+(run_batch over the configured number of questions) in a fresh process, so memory
+high-water marks are per scenario. Reports throughput, per-question latency percentiles,
+peak RSS and the summed trace counters, and can compare against a previous report:
+
+    python benchmarks/run_benchmark.py --report bench.json
+    python benchmarks/run_benchmark.py --scenario many_questions --baseline bench.json --tolerance 0.2
+
+Exits with status 1 when a metric regresses by more than --tolerance against --baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+from typing import Any, Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    # many short questions in flight at once: scheduling, client pools, per-question overhead
+    "many_questions": {"questions": 200, "concurrency": 64, "turns": 4, "max_cycles": 2, "page_bytes": 4000},
+    # few questions with very long rollouts: per-turn message bookkeeping and token estimation
+    "long_trajectory": {"questions": 4, "concurrency": 4, "turns": 100, "max_cycles": 1, "page_bytes": 2000},
+    # large tool outputs: JSON decoding, truncation, memory
+    "large_tool_outputs": {"questions": 16, "concurrency": 16, "turns": 6, "max_cycles": 1, "page_bytes": 200_000},
+}
+
+# metric -> direction in which it gets worse
+REGRESSION_METRICS = {"questions_per_s": "lower", "latency_p95_s": "higher", "peak_rss_mb": "higher"}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get_json(url: str) -> Dict[str, Any]:
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def _run_worker(scenario: Dict[str, Any], base_url: str, config_path: str, streaming: bool) -> Dict[str, Any]:
+    # settings read from the environment at import time must be in place before retrac is imported
+    os.environ["TOOL_SERVER_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "EMPTY")
+    from retrac.batch import run_batch
+    from retrac.components import aclose_llm_clients
+    from retrac.config import load_config
+    from retrac.graph import build_graph
+    from retrac.transport import aclose_tool_transport
+
+    cfg = load_config(config_path)
+    cfg["max_cycles"] = scenario["max_cycles"]
+    cfg["max_turns"] = max(cfg.get("max_turns", 0), scenario["turns"] * 2)
+    cfg["model"].update({"base_url": f"{base_url}/v1", "api_key": "EMPTY", "streaming": streaming, "enable_qps_limit": False})
+    app = build_graph(cfg).compile()
+    records = [{"id": f"q{i}", "question": f"Benchmark question {i}: what is the capital of France?"} for i in range(scenario["questions"])]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "results.jsonl")
+        start = time.perf_counter()
+        try:
+            counts = await run_batch(app, records, output, scenario["concurrency"], {"recursion_limit": 100_000})
+        finally:
+            await aclose_llm_clients()
+            await aclose_tool_transport()
+        wall_s = time.perf_counter() - start
+        with open(output, encoding="utf-8") as f:
+            results = [json.loads(line) for line in f]
+
+    latencies = [r["elapsed_s"] for r in results if r["status"] == "done"]
+    counters: Counter = Counter()
+    for r in results:
+        counters.update(((r.get("process_details") or {}).get("trace") or {}).get("counters") or {})
+    return {
+        "questions": len(records),
+        "done": counts["done"],
+        "failed": counts["failed"],
+        "wall_s": round(wall_s, 3),
+        "questions_per_s": round(counts["done"] / wall_s, 3) if wall_s else 0.0,
+        "latency_p50_s": round(_percentile(latencies, 0.50), 3),
+        "latency_p95_s": round(_percentile(latencies, 0.95), 3),
+        "latency_p99_s": round(_percentile(latencies, 0.99), 3),
+        "trace_counters": {k: round(v, 3) for k, v in sorted(counters.items())},
+    }
+
+
+def worker_main(args: argparse.Namespace) -> None:
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+    result = asyncio.run(_run_worker(SCENARIOS[args.scenario[0]], args.base_url, args.config, args.streaming))
+    # ru_maxrss is in KiB on Linux
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    if args.tracemalloc:
+        result["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+    with open(args.worker_output, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def run_scenario(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    scenario = SCENARIOS[name]
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    mock = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "mock_servers.py"), "--port", str(port),
+        "--turns", str(scenario["turns"]), "--page-bytes", str(scenario["page_bytes"]),
+        "--prefill-s-per-1k-tokens", str(args.prefill_s_per_1k_tokens), "--decode-s-per-token", str(args.decode_s_per_token),
+        "--tool-latency-s", str(args.tool_latency_s),
+    ])
+    try:
+        for _ in range(100):
+            try:
+                _get_json(f"{base_url}/health")
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("mock server did not start")
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            worker_output = f.name
+        cmd = [
+            sys.executable, os.path.abspath(__file__), "--worker", "--scenario", name, "--base-url", base_url,
+            "--config", args.config, "--worker-output", worker_output,
+        ]
+        cmd += ["--streaming"] if args.streaming else []
+        cmd += ["--tracemalloc"] if args.tracemalloc else []
+        subprocess.run(cmd, check=True, cwd=ROOT)
+        with open(worker_output, encoding="utf-8") as f:
+            result = json.load(f)
+        os.unlink(worker_output)
+        result["mock_stats"] = _get_json(f"{base_url}/stats")
+        return result
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    found = []
+    for name, result in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        for metric, worse in REGRESSION_METRICS.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (worse == "higher" and change > tolerance) or (worse == "lower" and -change > tolerance):
+                found.append(f"{name}.{metric}: {old} -> {new} ({change:+.0%})")
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--config", default=os.path.join(ROOT, "retrac", "deep_research.yaml"))
+    parser.add_argument("--streaming", action="store_true", help="stream LLM responses (model.streaming)")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--prefill-s-per-1k-tokens", type=float, default=0.002)
+    parser.add_argument("--decode-s-per-token", type=float, default=0.0005)
+    parser.add_argument("--tool-latency-s", type=float, default=0.01)
+    parser.add_argument("--report", help="write the JSON report here")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression per metric")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args)
+        return
+
+    report: Dict[str, Any] = {"streaming": args.streaming, "scenarios": {}}
+    for name in args.scenario:
+        result = report["scenarios"][name] = run_scenario(name, args)
+        print(
+            f"{name:>20}: {result['done']}/{result['questions']} done, {result['questions_per_s']:.2f} q/s, "
+            f"p50 {result['latency_p50_s']:.2f}s p95 {result['latency_p95_s']:.2f}s, "
+            f"peak RSS {result['peak_rss_mb']:.0f} MB, {result['mock_stats'].get('llm_requests', 0)} LLM requests"
+        )
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
-from .config import register_tool
-from .tools import search, visit
+from .config import load_env, register_tool
 
-register_tool("search", search)
-register_tool("visit", visit)
+# resolved on first use, so importing retrac does not import the tools' HTTP/LLM SDKs
+register_tool("search", f"{__name__}.tools:search")
+register_tool("visit", f"{__name__}.tools:visit")
+register_tool("recall", f"{__name__}.tools:recall")
 
-__all__ = ["register_tool"]
+__all__ = ["load_env", "register_tool"]
@@ -0,0 +1,110 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Set
+from langchain_core.messages import BaseMessage, convert_to_openai_messages
+from .checkpoint import invoke_with_resume
+
+logger = logging.getLogger(__name__)
+
+
+def to_jsonable(obj: Any) -> Any:
+    """Convert graph state (messages included) into JSON-serializable data"""
+    if isinstance(obj, BaseMessage):
+        return convert_to_openai_messages(obj)
+    if isinstance(obj, dict):
+        return {k: to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(v) for v in obj]
+    if isinstance(obj, (str, int, float, bool)) or obj is None:
+        return obj
+    return str(obj)
+
+
+def question_id(record: Dict[str, Any]) -> str:
+    return str(record.get("id", record["question"]))
+
+
+def read_questions(path: str) -> List[Dict[str, Any]]:
+    """Read a JSONL file of {"question": ..., ["id": ...], ...} records"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Ids already answered successfully in an existing output file"""
+    done: Set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partially written line from an interrupted run
+            if record.get("status") == "done":
+                done.add(question_id(record))
+    return done
+
+
+def result_record(record: Dict[str, Any], state: Dict[str, Any] | None, error: BaseException | None, elapsed_s: float) -> Dict[str, Any]:
+    result = dict(record)
+    result["elapsed_s"] = round(elapsed_s, 3)
+    if error is not None:
+        result["status"] = "failed"
+        result["exception"] = f"{type(error).__name__}: {error}"
+        return result
+    result["status"] = "done"
+    result["output"] = state.get("output")
+    result["error"] = state.get("error", [])
+    result["process_details"] = to_jsonable(state.get("process_details", {}))
+    return result
+
+
+async def run_batch(
+    app: Any,
+    records: Iterable[Dict[str, Any]],
+    output_path: str,
+    concurrency: int,
+    run_config: Dict[str, Any],
+) -> Dict[str, int]:
+    """Run a compiled graph over many questions, appending each result to output_path as it finishes.
+
+    When the graph has a checkpointer, each question runs on a thread named after its id,
+    so questions interrupted mid-run resume from their last completed cycle.
+    """
+    done = completed_ids(output_path)
+    pending = [r for r in records if question_id(r) not in done]
+    logger.info("Batch: %d questions pending, %d already completed", len(pending), len(done))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    counts = {"done": 0, "failed": 0, "skipped": len(done)}
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def run_one(record: Dict[str, Any]) -> None:
+            async with semaphore:
+                start = time.monotonic()
+                state, error = None, None
+                try:
+                    state = await invoke_with_resume(app, record["question"], run_config, question_id(record))
+                except Exception as e:
+                    logger.error("Question %s failed: %s", question_id(record), e, exc_info=True)
+                    error = e
+                result = result_record(record, state, error, time.monotonic() - start)
+                line = json.dumps(result, ensure_ascii=False) + "\n"
+            async with write_lock:
+                out.write(line)
+                out.flush()
+                counts[result["status"]] += 1
+
+        await asyncio.gather(*[run_one(r) for r in pending])
+    return counts
@@ -0,0 +1,249 @@
+from __future__ import annotations
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict
+from urllib.parse import urlsplit, urlunsplit
+from .resilience import with_deadline
+
+logger = logging.getLogger(__name__)
+
+# empty path disables the cache
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH", "")
+TOOL_CACHE_TTL_S = float(os.getenv("TOOL_CACHE_TTL_S", 7 * 24 * 3600))
+TOOL_CACHE_MAX_BYTES = int(os.getenv("TOOL_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so trivially different spellings share a key"""
+    return " ".join(query.lower().split())
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so the same page shares a key: lowercase scheme/host, no default port or fragment"""
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        netloc = parts.netloc.lower()
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if (scheme, netloc.rsplit(":", 1)[-1]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def content_key(*parts: Any) -> str:
+    """Content-addressed key for arbitrary JSON-serializable parts"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ToolCache:
+    """Tool result cache interface; the base class caches nothing"""
+
+    # whether _get/_set block and should run off the event loop
+    blocking = False
+
+    def __init__(self) -> None:
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+
+    def _get(self, namespace: str, key: str) -> Any | None:
+        return None
+
+    def _set(self, namespace: str, key: str, value: Any) -> None:
+        pass
+
+    async def get(self, namespace: str, key: str) -> Any | None:
+        if self.blocking:
+            value = await asyncio.to_thread(self._get, namespace, key)
+        else:
+            value = self._get(namespace, key)
+        if value is None:
+            self.misses[namespace] += 1
+        else:
+            self.hits[namespace] += 1
+        return value
+
+    async def set(self, namespace: str, key: str, value: Any) -> None:
+        if self.blocking:
+            await asyncio.to_thread(self._set, namespace, key, value)
+        else:
+            self._set(namespace, key, value)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            ns: {"hits": self.hits[ns], "misses": self.misses[ns]}
+            for ns in sorted(set(self.hits) | set(self.misses))
+        }
+
+
+class SQLiteToolCache(ToolCache):
+    """On-disk cache with TTL expiry and size-bounded LRU eviction"""
+
+    blocking = True
+
+    def __init__(
+        self,
+        path: str,
+        ttl_s: float = TOOL_CACHE_TTL_S,
+        max_bytes: int = TOOL_CACHE_MAX_BYTES,
+    ) -> None:
+        super().__init__()
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _get(self, namespace: str, key: str) -> Any | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, size, created FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            value, size, created = row
+            if now - created > self.ttl_s:
+                self._conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+                self._total_bytes -= size
+                return None
+            self._conn.execute(
+                "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+        return json.loads(value)
+
+    def _set(self, namespace: str, key: str, value: Any) -> None:
+        blob = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, blob, len(blob), now, now),
+            )
+            self._total_bytes += len(blob) - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl_s,))
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        excess = self._total_bytes - int(self.max_bytes * 0.9)
+        victims = []
+        for namespace, key, size in self._conn.execute(
+            "SELECT namespace, key, size FROM entries ORDER BY accessed"
+        ):
+            if excess <= 0:
+                break
+            victims.append((namespace, key))
+            excess -= size
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_tool_cache: ToolCache | None = None
+
+
+def get_tool_cache() -> ToolCache:
+    """Return the process-wide tool cache, configured from TOOL_CACHE_PATH"""
+    global _tool_cache
+    if _tool_cache is None:
+        _tool_cache = SQLiteToolCache(TOOL_CACHE_PATH) if TOOL_CACHE_PATH else ToolCache()
+    return _tool_cache
+
+
+def tool_cache_stats() -> Dict[str, Dict[str, int]]:
+    return get_tool_cache().stats()
+
+
+def set_tool_cache(cache: ToolCache) -> None:
+    """Install a custom cache backend"""
+    global _tool_cache
+    _tool_cache = cache
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one in-flight request.
+
+    The shared request runs as its own task in an empty context, so neither one caller's
+    cancellation nor its question deadline or trace carries over to the others waiting on
+    the same key; each caller's wait is bounded by its own deadline instead.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.saved: Dict[str, int] = defaultdict(int)
+
+    def _joinable(self, flight_key: str) -> asyncio.Task | None:
+        task = self._inflight.get(flight_key)
+        return task if task is not None and task.get_loop() is asyncio.get_running_loop() else None
+
+    def in_flight(self, namespace: str, key: str) -> bool:
+        """Whether a call for key would join a request already in flight"""
+        return self._joinable(f"{namespace}:{key}") is not None
+
+    async def do(self, namespace: str, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight_key = f"{namespace}:{key}"
+        task = self._joinable(flight_key)
+        if task is not None:
+            self.saved[namespace] += 1
+            return await with_deadline(asyncio.shield(task))
+        task = asyncio.get_running_loop().create_task(fn(), context=contextvars.Context())
+        self.requests[namespace] += 1
+        self._inflight[flight_key] = task
+
+        def done(t: asyncio.Task) -> None:
+            if self._inflight.get(flight_key) is t:
+                del self._inflight[flight_key]
+            if not t.cancelled():
+                t.exception()  # retrieved here in case every waiter was cancelled
+
+        task.add_done_callback(done)
+        return await with_deadline(asyncio.shield(task))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {ns: {"requests": self.requests[ns], "saved": self.saved[ns]} for ns in self.requests}
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    return _single_flight
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    return _single_flight.stats()
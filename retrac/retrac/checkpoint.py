@@ -0,0 +1,159 @@
+from __future__ import annotations
+import contextlib
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from .evidence import question_evidence
+from .resilience import deadline_scope
+from .tracing import question_trace, span
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadNotFound(LookupError):
+    """A thread to resume has no checkpoint"""
+
+
+class CycleCheckpointSaver(BaseCheckpointSaver):
+    """Persist WebCycleResearchState only at cycle boundaries (and optionally after each tool step).
+
+    Wraps another saver. Intermediate checkpoints are acknowledged but not written, so a
+    resumed thread restarts from the last completed cycle instead of the last LLM turn.
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver, every_tool_step: bool = False) -> None:
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        self.every_tool_step = every_tool_step
+        # thread_id -> (number of completed cycles, id of the last persisted checkpoint)
+        self._threads: Dict[str, Tuple[int | None, str | None]] = {}
+        # thread_id -> channels written by checkpoints that were not persisted
+        self._unsaved: Dict[str, set] = {}
+
+    def _should_persist(self, thread_id: str, checkpoint: Checkpoint, metadata: CheckpointMetadata) -> bool:
+        values = checkpoint.get("channel_values", {})
+        cycles = len(values.get("cycle_histories") or [])
+        last_cycles, _ = self._threads.get(thread_id, (None, None))
+        if metadata.get("source") == "input" or last_cycles != cycles or values.get("output") is not None:
+            return True
+        if self.every_tool_step:
+            messages = values.get("messages") or []
+            return bool(messages) and isinstance(messages[-1], ToolMessage)
+        return False
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        if self._should_persist(thread_id, checkpoint, metadata):
+            cycles = len(checkpoint.get("channel_values", {}).get("cycle_histories") or [])
+            self._threads[thread_id] = (cycles, checkpoint["id"])
+            # savers that store channels separately only write those in new_versions: include
+            # the ones changed by skipped checkpoints, or the saved state would miss them
+            channel_versions = checkpoint["channel_versions"]
+            changed = self._unsaved.pop(thread_id, set()) | set(new_versions)
+            new_versions = {c: channel_versions[c] for c in changed if c in channel_versions}
+            return await self.saver.aput(config, checkpoint, metadata, new_versions)
+        self._unsaved.setdefault(thread_id, set()).update(new_versions)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": config["configurable"].get("checkpoint_ns", ""),
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        _, persisted_id = self._threads.get(thread_id, (None, None))
+        if config["configurable"].get("checkpoint_id") == persisted_id:
+            await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self.saver.aget_tuple(config)
+
+    async def alist(self, config: Optional[RunnableConfig], **kwargs: Any) -> AsyncIterator[CheckpointTuple]:
+        async for item in self.saver.alist(config, **kwargs):
+            yield item
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self._threads.pop(thread_id, None)
+        self._unsaved.pop(thread_id, None)
+        await self.saver.adelete_thread(thread_id)
+
+    def get_next_version(self, current: Any, channel: Any) -> Any:
+        return self.saver.get_next_version(current, channel)
+
+
+@contextlib.asynccontextmanager
+async def open_checkpointer(path: str | None, every_tool_step: bool = False) -> AsyncIterator[BaseCheckpointSaver | None]:
+    """Open a SQLite-backed cycle checkpointer, or yield None when path is empty"""
+    if not path:
+        yield None
+        return
+    try:
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError as e:
+        raise ImportError("Checkpointing requires `pip install langgraph-checkpoint-sqlite`") from e
+    async with AsyncSqliteSaver.from_conn_string(path) as saver:
+        yield CycleCheckpointSaver(saver, every_tool_step=every_tool_step)
+
+
+async def invoke_with_resume(
+    app: Any, question: str, run_config: Dict[str, Any], thread_id: str | None = None, resume_only: bool = False,
+) -> Dict[str, Any]:
+    """Run a question on its thread, resuming from the last checkpoint if the thread was interrupted.
+
+    With resume_only, a thread without checkpoints raises ThreadNotFound instead of starting a new run.
+
+    run_config["configurable"]["question_timeout_s"], when set, bounds every LLM and tool
+    request made for the question, including their retries. A timing and cost rollup of
+    the run is stored in process_details['trace'].
+    """
+    with deadline_scope(run_config.get("configurable", {}).get("question_timeout_s")), question_trace(thread_id) as trace, question_evidence():
+        with span("question", kind="question"):
+            state = await _invoke_with_resume(app, question, run_config, thread_id, resume_only)
+        if isinstance(state.get("process_details"), dict):
+            state["process_details"]["trace"] = trace.rollup()
+        return state
+
+
+async def resume_input(
+    app: Any, question: str, run_config: Dict[str, Any], thread_id: str | None, resume_only: bool = False,
+) -> Tuple[Dict[str, Any] | None, Dict[str, Any], Dict[str, Any] | None]:
+    """Graph input and config for a question's thread, and its final state if the thread already finished"""
+    if thread_id is None or app.checkpointer is None:
+        return {"question": question}, run_config, None
+    config = {**run_config, "configurable": {**run_config.get("configurable", {}), "thread_id": thread_id}}
+    snapshot = await app.aget_state(config)
+    if snapshot.values:
+        # only final sets output; checkpoints saved at cycle boundaries may have no next node recorded
+        if snapshot.values.get("output") is not None:
+            logger.info("Thread %s already finished, returning its final state", thread_id)
+            return None, config, snapshot.values
+        logger.info("Resuming thread %s before %s", thread_id, snapshot.next or "its next node")
+        return None, config, None
+    if resume_only:
+        raise ThreadNotFound(f"No checkpoint found for thread {thread_id}")
+    return {"question": question}, config, None
+
+
+async def _invoke_with_resume(
+    app: Any, question: str, run_config: Dict[str, Any], thread_id: str | None, resume_only: bool,
+) -> Dict[str, Any]:
+    graph_input, config, finished = await resume_input(app, question, run_config, thread_id, resume_only)
+    if finished is not None:
+        return finished
+    return await app.ainvoke(graph_input, config=config)
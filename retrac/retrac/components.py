@@ -1,71 +1,244 @@
 from __future__ import annotations
 import asyncio
-import time
-from typing import Any, Callable, Dict
+import contextlib
+import json
+from typing import Any, Callable, Dict, Iterable, List
 import logging
 import os
-from langchain_openai import ChatOpenAI
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
 from langchain_core.messages import BaseMessage, AIMessage
-from openai import BadRequestError
 from langchain_core.messages.tool import ToolCall
 from .config import ModelConfig
+from .ratelimit import get_rate_limiter
+from .resilience import (
+    CircuitOpenError, DeadlineExceeded, RetryPolicy, backoff_within_deadline, error_status,
+    get_circuit_breaker, is_retryable, with_deadline,
+)
+from .streaming import EarlyToolRunner, MalformedToolCall, ToolCallStreamParser
+from .tracing import record, record_usage, span
+
+if TYPE_CHECKING:
+    import httpx
 
 logger = logging.getLogger(__name__)
 
 RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", 5))
-RETRY_INTERVAL = int(os.getenv("LLM_RETRY_INTERVAL", 10))
-LLM_QPS_LIMIT = int(os.getenv("LLM_QPS_LIMIT", 40))
+# backoff grows from RETRY_BASE_DELAY up to RETRY_INTERVAL seconds, with full jitter
+RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 1))
+RETRY_INTERVAL = float(os.getenv("LLM_RETRY_INTERVAL", 10))
+RETRY_POLICY = RetryPolicy(attempts=RETRY_ATTEMPTS, base_delay_s=RETRY_BASE_DELAY, max_delay_s=RETRY_INTERVAL)
+CHARS_PER_TOKEN = 4.0
 
 
-# QPS limiter
-_async_qps_limit_states = {}
+@dataclass
+class _LoopClients:
+    llms: Dict[str, Any] = field(default_factory=dict)
+    http_clients: Dict[str, httpx.AsyncClient] = field(default_factory=dict)
+
+
+class LLMClientPool:
+    """Long-lived ChatOpenAI clients keyed by resolved model config and call kwargs"""
+
+    def __init__(self) -> None:
+        self._clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClients] = weakref.WeakKeyDictionary()
+
+    def _loop_clients(self) -> _LoopClients:
+        # httpx clients are tied to the loop that opened their connections, so each loop gets its own
+        loop = asyncio.get_running_loop()
+        clients = self._clients.get(loop)
+        if clients is None:
+            clients = self._clients[loop] = _LoopClients()
+        return clients
+
+    @staticmethod
+    def _llm_key(model_cfg: ModelConfig, kwargs: Dict[str, Any]) -> str:
+        cfg = model_cfg.model_dump(exclude={"tools"})
+        cfg["tools"] = [getattr(t, "name", repr(t)) for t in model_cfg.tools]
+        return json.dumps([cfg, kwargs], sort_keys=True, default=str)
+
+    @staticmethod
+    def _http_client(http_clients: Dict[str, httpx.AsyncClient], model_cfg: ModelConfig) -> httpx.AsyncClient:
+        key = json.dumps([
+            model_cfg.base_url,
+            model_cfg.max_connections,
+            model_cfg.max_keepalive_connections,
+            model_cfg.keepalive_expiry_s,
+        ])
+        client = http_clients.get(key)
+        if client is None or client.is_closed:
+            import httpx
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=model_cfg.max_connections,
+                    max_keepalive_connections=model_cfg.max_keepalive_connections,
+                    keepalive_expiry=model_cfg.keepalive_expiry_s,
+                ),
+                timeout=model_cfg.timeout_s,
+            )
+            http_clients[key] = client
+        return client
+
+    def get(self, model_cfg: ModelConfig, **kwargs: Any) -> Any:
+        """Return a cached (tool-bound) ChatOpenAI for this config, creating it on first use"""
+        clients = self._loop_clients()
+        key = self._llm_key(model_cfg, kwargs)
+        llm = clients.llms.get(key)
+        if llm is not None:
+            return llm
+
+        # deferred: langchain_openai pulls in the openai SDK
+        from langchain_openai import ChatOpenAI
+        use_responses_api = (model_cfg.api_type == "responses")
+        llm = ChatOpenAI(
+            model=model_cfg.model_name,
+            base_url=model_cfg.base_url,
+            api_key=model_cfg.api_key,
+            temperature=model_cfg.temperature,
+            top_p=model_cfg.top_p,
+            timeout=model_cfg.timeout_s,
+            use_responses_api=use_responses_api,
+            use_previous_response_id=use_responses_api,
+            http_async_client=self._http_client(clients.http_clients, model_cfg),
+            # also when ainvoke is streamed by LangGraph's "messages" stream mode (server, run.py),
+            # so responses keep the usage_metadata context tracking relies on
+            stream_usage=True,
+            **kwargs
+        )
+        if model_cfg.tools:
+            llm = llm.bind_tools(model_cfg.tools)
+        clients.llms[key] = llm
+        return llm
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections opened on the running loop"""
+        clients = self._clients.pop(asyncio.get_running_loop(), None)
+        if clients is None:
+            return
+        for client in clients.http_clients.values():
+            if not client.is_closed:
+                await client.aclose()
+
+
+_llm_client_pool = LLMClientPool()
+
+
+async def aclose_llm_clients() -> None:
+    """Close the process-wide LLM client pool"""
+    await _llm_client_pool.aclose()
+
+
+def estimate_prompt_tokens(msgs: List[BaseMessage]) -> int:
+    """Rough prompt size used to reserve token budget, anchored on the last reported usage"""
+    chars = 0
+    for m in reversed(msgs):
+        if isinstance(m, AIMessage) and m.usage_metadata:
+            return m.usage_metadata.get("total_tokens", 0) + int(chars / CHARS_PER_TOKEN)
+        chars += len(m.text or "")
+    return int(chars / CHARS_PER_TOKEN)
+
+
+def _usage_cache_counts(usage: Dict[str, Any] | None) -> tuple[int, int]:
+    """(input tokens, input tokens served from the server's prefix cache) of one response"""
+    if not usage:
+        return 0, 0
+    return usage.get("input_tokens", 0), (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
 
-def async_qps_limiter(qps: int = LLM_QPS_LIMIT):
-    """Async QPS limiter decorator"""
-    def decorator(func):
-        state_key = f"async_qps_limiter_{id(func)}"
-        
-        async def wrapper(*args, **kwargs):
-            if state_key not in _async_qps_limit_states:
-                _async_qps_limit_states[state_key] = {
-                    "lock": asyncio.Lock(),
-                    "call_times": [],
-                    "qps": qps
-                }
-            
-            state = _async_qps_limit_states[state_key]
-            async with state["lock"]:
-                current_time = time.monotonic()
-                state["call_times"] = [
-                    call_time for call_time in state["call_times"]
-                    if current_time - call_time < 1.0
-                ]
-                
-                if len(state["call_times"]) >= state["qps"]:
-                    oldest_call = min(state["call_times"])
-                    wait_time = 1.0 - (current_time - oldest_call)
-                    if wait_time > 0:
-                        await asyncio.sleep(wait_time)
-                        current_time = time.monotonic()
-                        state["call_times"] = [
-                            call_time for call_time in state["call_times"]
-                            if current_time - call_time < 1.0
-                        ]
-                
-                state["call_times"].append(current_time)
-            
-            return await func(*args, **kwargs)
-        return wrapper
-    return decorator
+
+def _cache_totals(input_tokens: int, cached_tokens: int) -> Dict[str, Any]:
+    return {
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "cached_ratio": round(cached_tokens / input_tokens, 4) if input_tokens else 0.0,
+    }
+
+
+def prompt_cache_usage(messages: Iterable[BaseMessage]) -> Dict[str, Any]:
+    """Input and cached token totals over the AI messages of a conversation"""
+    input_tokens = cached_tokens = 0
+    for m in messages:
+        if isinstance(m, AIMessage):
+            i, c = _usage_cache_counts(m.usage_metadata)
+            input_tokens += i
+            cached_tokens += c
+    return _cache_totals(input_tokens, cached_tokens)
+
+
+def merge_prompt_cache_usage(usages: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum prompt_cache_usage results, e.g. over the rollouts of a question"""
+    input_tokens = cached_tokens = 0
+    for usage in usages:
+        input_tokens += usage.get("input_tokens", 0)
+        cached_tokens += usage.get("cached_tokens", 0)
+    return _cache_totals(input_tokens, cached_tokens)
+
+
+# endpoint -> [input tokens, cached input tokens] over the life of the process
+_prompt_cache_totals: Dict[str, List[int]] = {}
+
+
+def prompt_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-endpoint cached-token ratio reported by the servers since process start"""
+    return {endpoint: _cache_totals(i, c) for endpoint, (i, c) in _prompt_cache_totals.items()}
 
 
 def create_llm_node(
     model_cfg: ModelConfig,
     key: str = "messages",
+    cache_key_field: str | None = None,
+    tool_runner: EarlyToolRunner | None = None,
 ) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """Create an LLM node that returns only the new AI message under `key`.
+
+    With cache_key_field set, the state's 'prompt_cache_key' is sent in that extra_body
+    field so routers and servers can keep requests sharing a prefix on the same cache.
+    With model_cfg.streaming, tool calls are handed to tool_runner as soon as they are
+    complete in the stream.
+    """
+
+    limiter = None
+    if model_cfg.enable_qps_limit:
+        limiter = get_rate_limiter(
+            model_cfg.base_url,
+            qps=model_cfg.qps_limit,
+            tpm=model_cfg.tpm_limit,
+            max_concurrency=model_cfg.max_concurrency,
+        )
 
-    tools = model_cfg.tools
-    api_type = model_cfg.api_type
+    async def _generate(llm: Any, msgs: List[BaseMessage], invoke_kwargs: Dict[str, Any]) -> AIMessage:
+        if not model_cfg.streaming:
+            return await llm.ainvoke(msgs, **invoke_kwargs)
+        parser = ToolCallStreamParser()
+        started: List[ToolCall] = []
+        started_at = time.monotonic()
+
+        def start(calls: List[ToolCall]) -> None:
+            started.extend(calls)
+            if tool_runner is not None:
+                for call in calls:
+                    tool_runner.start(call)
+
+        first_chunk = True
+        try:
+            # leaving the block closes the stream, which aborts the rest of the generation server-side
+            async with contextlib.aclosing(llm.astream(msgs, **invoke_kwargs)) as stream:
+                async for chunk in stream:
+                    if first_chunk:
+                        # time to first token: queueing plus prefill
+                        record("llm_ttft_s", time.monotonic() - started_at)
+                        first_chunk = False
+                    start(parser.feed(chunk))
+                    if parser.finished:
+                        break
+            if not parser.finished:
+                start(parser.close())
+        except BaseException:
+            if tool_runner is not None:
+                tool_runner.cancel(started)
+            raise
+        return parser.message()
 
     async def _llm_ainvoke(
         state: Dict[str, Any],
@@ -76,10 +249,10 @@ def create_llm_node(
         if not state.get(key):
             raise ValueError(f"State '{key}' field cannot be empty")
 
+        # the graph's messages reducer validates each message as it is appended
         msgs = state[key]
-        if any(not isinstance(m, BaseMessage) for m in msgs):
-            bad = next(type(m).__name__ for m in msgs if not isinstance(m, BaseMessage))
-            raise TypeError(f"state['{key}'] must be List[BaseMessage], found {bad}")
+        if not isinstance(msgs[-1], BaseMessage):
+            raise TypeError(f"state['{key}'] must be List[BaseMessage], found {type(msgs[-1]).__name__}")
         
         extra_body: Dict[str, Any] = {}
         if model_cfg.extra_body:
@@ -89,27 +262,30 @@ def create_llm_node(
         if extra_body:
             kwargs["extra_body"] = extra_body
 
-        use_responses_api = (api_type == "responses")
-        
-        llm = ChatOpenAI(
-            model=model_cfg.model_name,
-            base_url=model_cfg.base_url,
-            api_key=model_cfg.api_key,
-            temperature=model_cfg.temperature,
-            top_p=model_cfg.top_p,
-            timeout=model_cfg.timeout_s,
-            use_responses_api=use_responses_api,
-            use_previous_response_id=use_responses_api,
-            **kwargs
-        )
-        if tools:
-            llm = llm.bind_tools(tools)
+        llm = _llm_client_pool.get(model_cfg, **kwargs)
+        invoke_kwargs: Dict[str, Any] = {}
+        if cache_key_field and state.get("prompt_cache_key"):
+            # per-request tag, kept out of the pooled client's cache key
+            invoke_kwargs["extra_body"] = {**extra_body, cache_key_field: state["prompt_cache_key"]}
 
+        estimated_tokens = estimate_prompt_tokens(msgs) if limiter is not None else 0
         error = state.get("error", [])
+        breaker = get_circuit_breaker(model_cfg.base_url)
         for llm_attempt_idx in range(RETRY_ATTEMPTS):
             try:
-                resp: AIMessage = await llm.ainvoke(msgs)
+                with span("llm.request", kind="client", model=model_cfg.model_name, attempt=llm_attempt_idx):
+                    breaker.before()
+                    breaker.stats["attempts"] += 1
+                    async with (limiter.limit(estimated_tokens) if limiter is not None else contextlib.nullcontext()):
+                        resp: AIMessage = await with_deadline(_generate(llm, msgs, invoke_kwargs))
+                    record_usage(resp.usage_metadata)
+                breaker.record_success()
+                if limiter is not None:
+                    await limiter.settle(estimated_tokens, (resp.usage_metadata or {}).get("total_tokens"))
                 logger.debug("LLM invocation successful, response length: %s", len(resp.text or ""))
+                totals = _prompt_cache_totals.setdefault(model_cfg.base_url, [0, 0])
+                for i, n in enumerate(_usage_cache_counts(resp.usage_metadata)):
+                    totals[i] += n
 
                 if "<tool_call>finish</tool_call>" in resp.text:
                     logger.error("Finish tool call found in response: %s", resp.text)
@@ -121,14 +297,44 @@ def create_llm_node(
                     error.append("Tool call not parsed correctly")
                     continue
 
-                return {key: msgs + [resp]}
+                return {key: [resp]}
+            except MalformedToolCall as e:
+                breaker.record_success()
+                logger.error("Aborted malformed generation: %s", e)
+                error.append("Tool call not parsed correctly")
+                continue
+            except DeadlineExceeded as e:
+                # our budget ran out, which says nothing about the endpoint
+                breaker.release_probe()
+                error.append(f"LLM invocation stopped on attempt [{llm_attempt_idx}/{RETRY_ATTEMPTS}] : {e}")
+                break
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
             except Exception as e:
                 msg = str(e)
                 logger.error("LLM invocation failed: %s", msg, exc_info=True)
                 error.append(f"LLM invocation failed on attempt [{llm_attempt_idx}/{RETRY_ATTEMPTS}] : {msg}")
-                if isinstance(e, BadRequestError) and "context length" in msg:
+                if is_retryable(e):
+                    if not isinstance(e, CircuitOpenError):
+                        breaker.record_failure()
+                else:
+                    breaker.record_success()
+                    # the server rejected the request itself (e.g. context length), resending cannot help
+                    if error_status(e) is not None:
+                        break
+                if llm_attempt_idx == RETRY_ATTEMPTS - 1:
                     break
-                await asyncio.sleep(RETRY_INTERVAL)
+                try:
+                    delay = backoff_within_deadline(RETRY_POLICY.delay(llm_attempt_idx, e))
+                except DeadlineExceeded as deadline:
+                    error.append(str(deadline))
+                    break
+                breaker.stats["retries"] += 1
+                breaker.stats["retry_wait_s"] += delay
+                record("retries")
+                record("retry_wait_s", delay)
+                await asyncio.sleep(delay)
 
         return {"error": error}
 
@@ -138,11 +344,4 @@ def create_llm_node(
     ) -> Dict[str, Any]:
         return await _llm_ainvoke(state, **kwargs)
 
-    @async_qps_limiter(qps=LLM_QPS_LIMIT)
-    async def qps_limited_llm_ainvoke(
-        state: Dict[str, Any],
-        **kwargs: Any,
-    ) -> Dict[str, Any]:
-        return await _llm_ainvoke(state, **kwargs)
-
-    return llm_ainvoke if not model_cfg.enable_qps_limit else qps_limited_llm_ainvoke
+    return llm_ainvoke
@@ -1,22 +1,53 @@
 from __future__ import annotations
+import importlib
 import os
-from typing import Any, Dict, List, Sequence
+from typing import Any, Callable, Dict, List, Optional, Sequence
 from pydantic import BaseModel, Field, field_validator
 from typing_extensions import Literal
-from dotenv import load_dotenv
-load_dotenv()
 
-print("="*100)
-print(f"OPENAI_API_BASE: {os.getenv('OPENAI_API_BASE')}")
-print(f"OPENAI_API_KEY: {os.getenv('OPENAI_API_KEY')}")
-print("="*100)
 
-# Tool registry
+def load_env(path: str | None = None, override: bool = False) -> bool:
+    """Load a .env file into os.environ.
+
+    Call once at program start, before importing modules that read their settings from
+    the environment (components, tools, transport, ...). Importing retrac never does it.
+    """
+    from dotenv import load_dotenv
+    return load_dotenv(path, override=override)
+
+
+def load_config(config_path: str) -> dict:
+    """Load a graph config from YAML"""
+    import yaml
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    return config
+
+
+# Tool registry: name -> tool object, or a lazy reference resolved on first use
 _TOOL_REGISTRY: Dict[str, object] = {}
 
-def register_tool(name: str, tool: object):
-    """Register a tool"""
-    _TOOL_REGISTRY[name] = tool
+
+class _ToolFactory:
+    def __init__(self, factory: str | Callable[[], object]) -> None:
+        self.factory = factory
+
+    def resolve(self) -> object:
+        if callable(self.factory):
+            return self.factory()
+        module, _, attr = self.factory.partition(":")
+        return getattr(importlib.import_module(module), attr)
+
+
+def register_tool(name: str, tool: object = None, factory: str | Callable[[], object] | None = None):
+    """Register a tool, or a factory resolved on first use.
+
+    A string tool ("package.module:attribute") or an explicit zero-argument factory
+    defers importing the tool (and its SDKs) until a graph actually uses it.
+    """
+    if factory is None and isinstance(tool, str):
+        factory = tool
+    _TOOL_REGISTRY[name] = _ToolFactory(factory) if factory is not None else tool
 
 def resolve_tools(names: Sequence[str]) -> List[object]:
     """Resolve tool names to tool objects"""
@@ -24,22 +55,54 @@ def resolve_tools(names: Sequence[str]) -> List[object]:
     for n in names:
         if n not in _TOOL_REGISTRY:
             raise KeyError(f"Tool '{n}' not registered. Available: {sorted(_TOOL_REGISTRY)}")
-        tools.append(_TOOL_REGISTRY[n])
+        entry = _TOOL_REGISTRY[n]
+        if isinstance(entry, _ToolFactory):
+            entry = _TOOL_REGISTRY[n] = entry.resolve()
+        tools.append(entry)
     return tools
 
 
+class VisitSummarizeConfig(BaseModel):
+    """Chunked map-reduce summarization limits for the visit tool"""
+    model_config = {"extra": "forbid"}
+
+    single_pass_tokens: int = Field(default=24000, description="pages up to this size are summarized in one request")
+    chunk_tokens: int = Field(default=4000, description="max tokens per chunk")
+    max_chunks: int = Field(default=8, description="number of most relevant chunks to summarize")
+    max_parallel: int = Field(default=8, description="max concurrent chunk summarization requests")
+    chars_per_token: float = Field(default=4.0, description="estimator used to bound chunks in tokens")
+
+
+class PromptCacheConfig(BaseModel):
+    """Prompt layout and request tagging for server-side prefix (KV) caching"""
+    model_config = {"extra": "forbid"}
+
+    stable_prefix: bool = Field(default=False, description="keep the system prompt and question byte-identical in every cycle and put cycle-specific text last")
+    cache_key_field: str | None = Field(default=None, description="extra_body field that carries the cache key, e.g. 'prompt_cache_key' or a router's session affinity field")
+    cache_key_scope: Literal["question", "system_prompt"] = Field(default="question", description="share one key per question, or one key across all questions with the same system prompt")
+
+
 class ModelConfig(BaseModel):
     """Model configuration"""
     model_config = {"extra": "forbid"}
     
     model_name: str = Field(...)
-    base_url: str = Field(default=os.getenv("OPENAI_API_BASE"), description="model base url")
-    api_key: str = Field(default=os.getenv("OPENAI_API_KEY"), description="model api key")
+    base_url: str = Field(default_factory=lambda: os.getenv("OPENAI_API_BASE"), description="model base url")
+    api_key: str = Field(default_factory=lambda: os.getenv("OPENAI_API_KEY"), description="model api key", repr=False)
     temperature: float | None = None
     timeout_s: int | None = None
     top_p: float | None = Field(default=None, description="top_p for sampling")
     max_context_length: int | None = None
+    tokenizer: str | None = Field(default=None, description="HuggingFace tokenizer name/path or 'tiktoken:<encoding>' for pre-flight token counts; a calibrated estimator is used when unset")
+    max_tool_message_tokens: int | None = Field(default=None, description="truncate any single tool output above this many tokens")
+    streaming: bool = Field(default=False, description="stream responses, start tool calls as soon as they are complete and abort malformed generations early")
     enable_qps_limit: bool = False
+    qps_limit: float | None = Field(default_factory=lambda: float(os.getenv("LLM_QPS_LIMIT", 40)), description="requests/sec budget for the endpoint")
+    tpm_limit: int | None = Field(default_factory=lambda: int(os.getenv("LLM_TPM_LIMIT", 0)) or None, description="prompt+completion tokens/min budget for the endpoint")
+    max_concurrency: int | None = Field(default_factory=lambda: int(os.getenv("LLM_MAX_CONCURRENCY", 0)) or None, description="max in-flight requests to the endpoint across all workers")
+    max_connections: int = Field(default=100, description="max open HTTP connections per LLM endpoint")
+    max_keepalive_connections: int = Field(default=20, description="max idle keep-alive connections per LLM endpoint")
+    keepalive_expiry_s: float = Field(default=30.0, description="seconds an idle keep-alive connection is kept")
     tools: List[Any] = []
     api_type: Literal["responses", "chat_completion"] = 'chat_completion'
     extra_body: Dict[str, Any] = Field(
@@ -54,3 +117,23 @@ class ModelConfig(BaseModel):
         if isinstance(v, list) and v and isinstance(v[0], str):
             return resolve_tools(v)
         return v
+
+
+DEFAULT_VERIFIER_PROMPT = """Question: {input}
+Proposed answer: {answer}
+Summary of the research so far:
+{summary}
+Is the proposed answer definitively supported by verified evidence in the summary? Reply with exactly YES or NO.
+"""
+
+
+class ConvergenceConfig(BaseModel):
+    """Stop cycling once the summary's current answer has converged"""
+    model_config = {"extra": "forbid"}
+
+    enabled: bool = False
+    stable_cycles: int = Field(default=2, ge=1, description="consecutive cycles that must report the same definite answer")
+    min_cycles: int = Field(default=1, ge=1, description="never stop before this many cycles")
+    use_verifier: bool = Field(default=False, description="also require a YES from a verifier call before stopping")
+    verifier_model: Optional[ModelConfig] = Field(default=None, description="cheap model for the verifier, defaults to the agent model")
+    verifier_prompt: str = DEFAULT_VERIFIER_PROMPT
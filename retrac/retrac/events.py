@@ -0,0 +1,82 @@
+from __future__ import annotations
+import contextlib
+from typing import Any, AsyncIterator, Dict, List
+from langchain_core.messages import AIMessageChunk, BaseMessage, convert_to_openai_messages
+from .batch import to_jsonable
+from .checkpoint import resume_input
+from .evidence import question_evidence
+from .graph import ResetMessages
+from .resilience import deadline_scope
+from .tracing import question_trace, span
+
+
+def _message_events(node: str, update: Dict[str, Any]) -> List[Dict[str, Any]]:
+    messages = update.get("messages")
+    if isinstance(messages, ResetMessages):
+        # a cycle (or the question) starts over from these messages
+        return [{"event": "reset", "node": node, "messages": convert_to_openai_messages(messages.messages)}]
+    return [
+        {"event": "message", "node": node, "message": convert_to_openai_messages(m)}
+        for m in messages or [] if isinstance(m, BaseMessage)
+    ]
+
+
+def _token_event(chunk: Any, metadata: Dict[str, Any]) -> Dict[str, Any] | None:
+    # "messages" mode also replays complete messages found in node outputs; those arrive as "message" events
+    if not isinstance(chunk, AIMessageChunk):
+        return None
+    event: Dict[str, Any] = {"event": "token", "node": metadata.get("langgraph_node")}
+    if chunk.text:
+        event["content"] = chunk.text
+    if chunk.tool_call_chunks:
+        event["tool_call_chunks"] = [dict(tc) for tc in chunk.tool_call_chunks]
+    return event if len(event) > 2 else None
+
+
+async def stream_question(
+    app: Any,
+    question: str,
+    run_config: Dict[str, Any],
+    thread_id: str | None = None,
+    tokens: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Run a question and yield JSON-serializable deltas as they happen.
+
+    Events: {"event": "node"} when a node finishes, "message" for each message it appended,
+    "reset" when it replaced the history, "token" for LLM output chunks (when tokens is set),
+    and a last "final" with the output and process_details (trace rollup included).
+    Like invoke_with_resume, a checkpointed thread resumes from its last checkpoint.
+    """
+    output: Dict[str, Any] = {}
+    with deadline_scope(run_config.get("configurable", {}).get("question_timeout_s")), question_trace(thread_id) as trace, question_evidence():
+        with span("question", kind="question"):
+            graph_input, config, finished = await resume_input(app, question, run_config, thread_id)
+            if finished is not None:
+                output = finished
+            else:
+                stream_mode = ["updates", "messages"] if tokens else ["updates"]
+                async with contextlib.aclosing(app.astream(graph_input, config=config, stream_mode=stream_mode)) as stream:
+                    async for mode, chunk in stream:
+                        if mode == "messages":
+                            event = _token_event(*chunk)
+                            if event is not None:
+                                yield event
+                            continue
+                        for node, update in chunk.items():
+                            yield {"event": "node", "node": node}
+                            if not isinstance(update, dict):
+                                continue
+                            for event in _message_events(node, update):
+                                yield event
+                            # the final node sets these; earlier nodes may update process_details along the way
+                            output.update({k: update[k] for k in ("output", "process_details", "error") if k in update})
+        process_details = output.get("process_details")
+        if isinstance(process_details, dict):
+            process_details["trace"] = trace.rollup()
+    yield {
+        "event": "final",
+        "thread_id": thread_id,
+        "output": output.get("output"),
+        "error": to_jsonable(output.get("error", [])),
+        "process_details": to_jsonable(process_details or {}),
+    }
@@ -0,0 +1,144 @@
+from __future__ import annotations
+import contextlib
+import contextvars
+import hashlib
+import heapq
+import os
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Tuple
+from .lexical import BM25_B, BM25_K1, bm25_idf, bm25_term, lexical_terms, split_chunks
+
+# question: one index per question (all its cycles); process: shared by every question of the process
+EVIDENCE_SCOPE = os.getenv("EVIDENCE_SCOPE", "question").lower()
+# index even when no graph uses the recall tool (e.g. for the already-visited note on visit)
+EVIDENCE_INDEX = os.getenv("EVIDENCE_INDEX", "0").lower() in ("1", "true", "yes")
+# oldest passages are evicted beyond this many per index
+EVIDENCE_MAX_PASSAGES = int(os.getenv("EVIDENCE_MAX_PASSAGES", 4000))
+EVIDENCE_PASSAGE_CHARS = int(os.getenv("EVIDENCE_PASSAGE_CHARS", 1200))
+
+
+@dataclass
+class Passage:
+    text: str
+    url: str | None
+    title: str | None
+    source: str
+    terms: Counter
+    length: int
+
+
+class EvidenceIndex:
+    """In-memory BM25 index over search results and fetched pages, with the set of URLs already visited"""
+
+    def __init__(self, max_passages: int = EVIDENCE_MAX_PASSAGES, k1: float = BM25_K1, b: float = BM25_B) -> None:
+        self.max_passages = max_passages
+        self.k1 = k1
+        self.b = b
+        self._passages: OrderedDict[int, Passage] = OrderedDict()
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._seen: Dict[str, int] = {}
+        self._total_length = 0
+        self._next_id = 0
+        # normalized URL -> goals it was visited with
+        self.visited: Dict[str, List[str]] = {}
+        self.stats = {"added": 0, "duplicates": 0, "evicted": 0, "lookups": 0}
+
+    def __len__(self) -> int:
+        return len(self._passages)
+
+    def _key(self, text: str, url: str | None) -> str:
+        return hashlib.sha1(f"{url}\0{text}".encode("utf-8")).hexdigest()
+
+    def _evict(self) -> None:
+        pid, passage = self._passages.popitem(last=False)
+        for term in passage.terms:
+            postings = self._postings[term]
+            postings.pop(pid, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= passage.length
+        self._seen.pop(self._key(passage.text, passage.url), None)
+        self.stats["evicted"] += 1
+
+    def add(self, text: str, url: str | None = None, title: str | None = None, source: str = "page") -> int:
+        """Index text (split into passages); returns the number of new passages"""
+        added = 0
+        for chunk in split_chunks(text or "", EVIDENCE_PASSAGE_CHARS):
+            key = self._key(chunk, url)
+            if key in self._seen:
+                self.stats["duplicates"] += 1
+                continue
+            terms = Counter(lexical_terms(f"{title or ''} {chunk}"))
+            if not terms:
+                continue
+            pid = self._next_id
+            self._next_id += 1
+            length = sum(terms.values())
+            self._passages[pid] = Passage(chunk, url, title, source, terms, length)
+            self._seen[key] = pid
+            self._total_length += length
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[pid] = tf
+            added += 1
+            while len(self._passages) > self.max_passages:
+                self._evict()
+        self.stats["added"] += added
+        return added
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, Passage]]:
+        """Top-k passages by BM25 score"""
+        self.stats["lookups"] += 1
+        n = len(self._passages)
+        if not n:
+            return []
+        avg_length = self._total_length / n
+        scores: Dict[int, float] = {}
+        for term in set(lexical_terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = bm25_idf(n, len(postings))
+            for pid, tf in postings.items():
+                score = bm25_term(idf, tf, self._passages[pid].length, avg_length, self.k1, self.b)
+                scores[pid] = scores.get(pid, 0.0) + score
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, self._passages[pid]) for pid, score in best]
+
+    def mark_visited(self, url: str, goal: str) -> None:
+        goals = self.visited.setdefault(url, [])
+        if goal not in goals:
+            goals.append(goal)
+
+
+_enabled = EVIDENCE_INDEX
+_process_index: EvidenceIndex | None = None
+_question_index: contextvars.ContextVar[EvidenceIndex | None] = contextvars.ContextVar("retrac_evidence", default=None)
+
+
+def enable_evidence_index() -> None:
+    """Index tool results from now on; build_graph calls this when a graph uses the recall tool"""
+    global _enabled
+    _enabled = True
+
+
+def get_evidence_index() -> EvidenceIndex | None:
+    """The index of the question running in this context, or None when indexing is off"""
+    if not _enabled:
+        return None
+    if EVIDENCE_SCOPE == "process":
+        global _process_index
+        if _process_index is None:
+            _process_index = EvidenceIndex()
+        return _process_index
+    return _question_index.get()
+
+
+@contextlib.contextmanager
+def question_evidence() -> Iterator[None]:
+    """Give the question run in this context (and the tasks it spawns) its own index, freed when it ends"""
+    token = _question_index.set(EvidenceIndex() if _enabled and EVIDENCE_SCOPE != "process" else None)
+    try:
+        yield
+    finally:
+        _question_index.reset(token)
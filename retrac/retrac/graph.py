@@ -1,12 +1,40 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, Literal
-from typing_extensions import TypedDict
+import asyncio
+import functools
+import hashlib
+import inspect
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Literal, Tuple
+from typing_extensions import Annotated, TypedDict
 from pydantic import BaseModel, Field
 from langgraph.graph import StateGraph, END
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import ToolNode
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, ToolMessage
-from .config import ModelConfig
-from .components import create_llm_node
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from .config import ConvergenceConfig, ModelConfig, PromptCacheConfig, VisitSummarizeConfig
+from .components import create_llm_node, merge_prompt_cache_usage, prompt_cache_usage
+from .evidence import enable_evidence_index
+from .resilience import remaining_time
+from .streaming import EarlyToolRunner
+from .tracing import current_trace, traced_node
+from .trajectory import get_trajectory_recorder
+from .tokens import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+# a rollout ends once fewer tokens than this are left for the next turn's tool outputs
+MIN_TURN_BUDGET_TOKENS = 1024
+
+PREVIOUS_ATTEMPTS_NOTE = "Also there are some summary for the previous attempts you have made, you can use them to help you answer the question."
+
+DEFAULT_FUSION_PROMPT = """Below are {num_summaries} summaries written by independent attempts at the same question: {input}.
+{summaries}
+Merge them into a single summary. Keep every fact with its source annotation, resolve conflicts by stating both claims and which one is better supported, and union the uncertainties and gaps.
+Use exactly the same output format as the individual summaries (sections 0 to 4), with "0) Current Answer" holding the best supported answer across all attempts or "None".
+"""
+
 
 class WebCycleResearchConfig(BaseModel):
     """Web cycle research configuration"""
@@ -16,111 +44,263 @@ class WebCycleResearchConfig(BaseModel):
     summary_prompt: str
     max_cycles: int
     max_turns: int
+    visit_summarize: Optional[VisitSummarizeConfig] = None
+    rollouts_per_cycle: int = Field(default=1, ge=1, description="independent rollouts run concurrently in each cycle")
+    fusion_prompt: str = DEFAULT_FUSION_PROMPT
+    early_exit_on_agreement: bool = Field(default=True, description="stop once all parallel rollouts report the same current answer")
+    convergence: ConvergenceConfig = Field(default_factory=ConvergenceConfig)
+    prompt_cache: PromptCacheConfig = Field(default_factory=PromptCacheConfig)
+
+
+@dataclass
+class ResetMessages:
+    """Update for the messages channel that replaces the history instead of appending to it"""
+    messages: List[BaseMessage]
+
+
+def append_messages(left: List[BaseMessage] | None, right: List[BaseMessage] | ResetMessages) -> List[BaseMessage]:
+    """Reducer for the append-only messages channel: nodes return only their new messages.
+
+    Only the delta is validated. The result is a new list rather than an in-place extend,
+    so checkpoints that are serialized asynchronously never see later appends.
+    """
+    if isinstance(right, ResetMessages):
+        left, right = [], right.messages
+    for m in right:
+        if not isinstance(m, BaseMessage):
+            raise TypeError(f"state['messages'] must be List[BaseMessage], found {type(m).__name__}")
+    return (left or []) + list(right)
 
 
 class WebCycleResearchState(TypedDict, total=False):
     """Web cycle research graph state"""
     question: str
     output: Optional[str]
-    messages: List[BaseMessage]
+    messages: Annotated[List[BaseMessage], append_messages]
     tool_input: List[BaseMessage]
     cycle_histories: List[List[BaseMessage]]
     process_details: Dict[str, Any]
     error: list[str]
+    stop_reason: Optional[str]
+    prompt_cache_key: Optional[str]
+    # running counters for the current rollout, so per-turn checks never rescan messages
+    tool_calls_num: int
+    context_tokens: int
+    # where the current rollout's messages are being logged (TRAJECTORY_DIR), None when not recorded
+    rollout_ref: Optional[Dict[str, Any]]
 
 
 def _has_tool_calls(msg: BaseMessage) -> bool:
     return isinstance(msg, AIMessage) and bool(getattr(msg, "tool_calls", None))
 
 
+def _strip_think(content: str) -> str:
+    return content.split("</think>")[-1] if "</think>" in content else content
+
+
+_CURRENT_ANSWER_RE = re.compile(r"0\)\s*Current Answer\s*(.*?)(?:\n\s*1\)\s*Facts|\Z)", re.S | re.I)
+
+
+def _current_answer(summary: str) -> Optional[str]:
+    """Extract the "0) Current Answer" section of a structured summary, None if missing or none given"""
+    match = _CURRENT_ANSWER_RE.search(_strip_think(summary))
+    if not match:
+        return None
+    answer = " ".join(match.group(1).strip().lstrip("-*: ").split())
+    if not answer or answer.lower().rstrip(".") in ("none", "n/a", "unknown"):
+        return None
+    return answer
+
+
+def _normalize_answer(answer: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", answer.lower()).split())
+
+
+def _history_text(cycle_history: List[BaseMessage | None]) -> str:
+    """The summary a cycle ended with, without reasoning; empty when the summary request failed"""
+    message = cycle_history[-1] if cycle_history else None
+    if message is None:
+        return ""
+    return _strip_think(message.text if isinstance(message, BaseMessage) else str(message.content))
+
+
 def build_graph(cfg: dict) -> StateGraph:
     """Build web_cycle_research graph"""
     domain_cfg = WebCycleResearchConfig.model_validate(cfg)
     g = StateGraph(WebCycleResearchState)
+    if domain_cfg.visit_summarize is not None:
+        from .tools import configure_visit_summarize
+        configure_visit_summarize(domain_cfg.visit_summarize)
     
+    if any(getattr(t, "name", None) == "recall" for t in domain_cfg.model.tools):
+        enable_evidence_index()
     tool_node = ToolNode(domain_cfg.model.tools, messages_key="tool_input")
+    prompt_cache_cfg = domain_cfg.prompt_cache
+    tool_runner = EarlyToolRunner(domain_cfg.model.tools) if domain_cfg.model.streaming else None
     llm_node = create_llm_node(
         model_cfg=domain_cfg.model,
+        cache_key_field=prompt_cache_cfg.cache_key_field,
+        tool_runner=tool_runner,
     )
+    # summary and fusion calls never execute tools, so they must not start them early
+    plain_llm_node = create_llm_node(
+        model_cfg=domain_cfg.model,
+        cache_key_field=prompt_cache_cfg.cache_key_field,
+    ) if tool_runner is not None else llm_node
+    token_counter = TokenCounter(domain_cfg.model.tokenizer)
+    recorder = get_trajectory_recorder()
+    convergence_cfg = domain_cfg.convergence
+    verifier_node = None
+    if convergence_cfg.enabled and convergence_cfg.use_verifier:
+        verifier_node = create_llm_node(model_cfg=convergence_cfg.verifier_model or domain_cfg.model)
     
     def init_graph(state: WebCycleResearchState) -> Dict[str, Any]:
         patch: Dict[str, Any] = {}
 
-        print(f"State: {state}")
-        print(f"Domain config: {domain_cfg}")
+        logger.debug("Question: %s", state.get("question"))
+        logger.debug("Domain config: %s", domain_cfg)
 
         assert "question" in state and state["question"] is not None, "question is required"
 
         if "messages" not in state or not state.get("messages"):
-            patch["messages"] = [
+            patch["messages"] = ResetMessages([
                 SystemMessage(content=domain_cfg.system_prompt), 
                 HumanMessage(content=state["question"])
-            ]
+            ])
+            patch["tool_calls_num"] = 0
         if "tool_input" not in state or state.get("tool_input") is None:
             patch["tool_input"] = []
         if "cycle_histories" not in state or state.get("cycle_histories") is None:
             patch["cycle_histories"] = []
         if "process_details" not in state or state.get("process_details") is None:
             patch["process_details"] = {'rollouts':[]}
+        if prompt_cache_cfg.cache_key_field and not state.get("prompt_cache_key"):
+            scoped = state["question"] if prompt_cache_cfg.cache_key_scope == "question" else domain_cfg.system_prompt
+            patch["prompt_cache_key"] = hashlib.sha256(scoped.encode("utf-8")).hexdigest()[:32]
         return patch
 
+    async def invoke_llm(messages: List[BaseMessage], cache_key: Optional[str] = None) -> Dict[str, Any]:
+        """Call the LLM outside the rollout loop; 'messages' holds the full conversation on success"""
+        result = await plain_llm_node({'messages': messages, 'prompt_cache_key': cache_key})
+        if result.get('messages'):
+            result['messages'] = messages + result['messages']
+        return result
+
+    async def summarize_rollout(messages: List[BaseMessage], question: str, cache_key: Optional[str] = None) -> Dict[str, Any]:
+        summary_prompt = domain_cfg.summary_prompt
+        return await invoke_llm(messages + [HumanMessage(content=summary_prompt.format(input=question))], cache_key)
+
+    def begin_rollout(messages: List[BaseMessage], question: str, cycle: int, index: int = 0) -> Optional[Dict[str, Any]]:
+        """Start logging a rollout from its initial messages, when trajectories are recorded"""
+        if recorder is None:
+            return None
+        trace = current_trace()
+        return recorder.begin(messages, question, trace.trace_id if trace is not None else None, cycle, index)
+
+    def rollout_entry(messages: List[BaseMessage], ref: Optional[Dict[str, Any]], summary_messages: int, **extra: Any) -> Dict[str, Any]:
+        """process_details['rollouts'] entry: the rollout's messages, or a reference to its log"""
+        entry: Dict[str, Any] = {**extra, 'prompt_cache': prompt_cache_usage(messages)}
+        if recorder is None or ref is None:
+            entry['messages'] = messages
+            return entry
+        recorder.append(ref, messages[len(messages) - summary_messages:])
+        entry['trajectory'] = recorder.end(ref, summary_messages)
+        return entry
+
+    def recorded(fn: Any) -> Any:
+        """Append the messages a rollout node adds to the rollout's log"""
+        if recorder is None:
+            return fn
+
+        @functools.wraps(fn)
+        async def wrapper(state: WebCycleResearchState, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+            patch = fn(state, *args, **kwargs)
+            if inspect.isawaitable(patch):
+                patch = await patch
+            ref = state.get("rollout_ref")
+            if ref is not None and isinstance(patch.get("messages"), list):
+                recorder.append(ref, patch["messages"])
+            return patch
+        return wrapper
+
     async def end_cycle(state: WebCycleResearchState) -> WebCycleResearchState:
         """End a cycle using summary strategy"""
-        summary_prompt = domain_cfg.summary_prompt
-        summary = await llm_node(
-            {'messages': state["messages"] + [HumanMessage(content=summary_prompt.format(input=state["question"]))]}
-        )
+        summary = await summarize_rollout(state["messages"], state["question"], state.get("prompt_cache_key"))
         cycle_histories = state["cycle_histories"] + [[summary.get('messages', [None])[-1]]]
 
-        if summary.get('messages'):
-            state["messages"] = summary['messages']
+        messages = summary.get('messages') or state["messages"]
+        entry = rollout_entry(messages, state.get("rollout_ref"), len(messages) - len(state["messages"]))
+        state["process_details"]['rollouts'].append(entry)
+        if 'trajectory' in entry:
+            # the full rollout is on disk; later nodes only need its last message
+            messages = messages[-1:]
 
-        state["process_details"]['rollouts'].append({
-            'messages': state["messages"],
-        })
-        
-        return {"cycle_histories": cycle_histories, "process_details": state["process_details"], "messages": state["messages"]}
+        return {
+            "cycle_histories": cycle_histories, "process_details": state["process_details"],
+            "messages": ResetMessages(messages), "rollout_ref": None,
+        }
     
     def cycle_check(state: WebCycleResearchState) -> Literal["final", "start_cycle"]:
-        if len(state["cycle_histories"]) >= domain_cfg.max_cycles:
+        if state.get("stop_reason") or len(state["cycle_histories"]) >= domain_cfg.max_cycles:
             return "final"
         else:
             return "start_cycle"
     
     async def start_cycle(state: WebCycleResearchState) -> WebCycleResearchState:
         """Start a new cycle using summary strategy"""
-        if len(state["cycle_histories"]) == 0:  # first cycle
-            return {}
-        
-        messages = [
-            SystemMessage(content=domain_cfg.system_prompt + "\nAlso there are some summary for the previous attempts you have made, you can use them to help you answer the question."), 
-            HumanMessage(content=state["question"])
-        ]
-        contents_without_think = []
-        for cycle_history in state["cycle_histories"]:
-            contents = [message.text if isinstance(message, BaseMessage) else str(message.content) for message in cycle_history]
-            # Remove reasoning part if exists
-            contents_without_think += [content.split("</think>")[-1] if "</think>" in content else content for content in contents]
+        cycle = len(state["cycle_histories"])
+        # with parallel rollouts, each rollout is logged from parallel_rollouts instead
+        record = domain_cfg.rollouts_per_cycle == 1
+        if cycle == 0:  # first cycle
+            return {"rollout_ref": begin_rollout(state["messages"], state["question"], cycle)} if record else {}
         
-        last_summary = contents_without_think[-1]
-        messages += [HumanMessage(content=domain_cfg.continue_prompt.format(last_summary=last_summary))]
-        return {"messages": messages}
+        if prompt_cache_cfg.stable_prefix:
+            # same system prompt and question as the first cycle, so the server can reuse their KV cache
+            messages = [SystemMessage(content=domain_cfg.system_prompt), HumanMessage(content=state["question"])]
+        else:
+            messages = [
+                SystemMessage(content=domain_cfg.system_prompt + "\n" + PREVIOUS_ATTEMPTS_NOTE), 
+                HumanMessage(content=state["question"])
+            ]
+        last_summary = _history_text(state["cycle_histories"][-1])
+        continue_prompt = domain_cfg.continue_prompt.format(last_summary=last_summary)
+        if prompt_cache_cfg.stable_prefix:
+            continue_prompt = PREVIOUS_ATTEMPTS_NOTE + "\n" + continue_prompt
+        messages += [HumanMessage(content=continue_prompt)]
+        patch = {"messages": ResetMessages(messages), "tool_calls_num": 0}
+        if record:
+            patch["rollout_ref"] = begin_rollout(messages, state["question"], cycle)
+        return patch
 
     def decide(state: WebCycleResearchState) -> Literal["tools", "end_cycle"]:
         """Decide next step: execute tools if tool calls exist, otherwise end cycle"""
         last: AIMessage = state["messages"][-1]
-        dlast = dict(last)
-        usage_metadata = dlast.get('usage_metadata', {})
-        tool_calls_num = sum([1 if isinstance(message, ToolMessage) else 0 for message in state["messages"]])
+        token_counter.calibrate(state["messages"])
+        usage_metadata = getattr(last, 'usage_metadata', None) or {}
+        tool_calls_num = state.get("tool_calls_num", 0)
         max_context = domain_cfg.model.max_context_length
         
         # Check if limits exceeded
         if (max_context is not None and usage_metadata.get("total_tokens", 0) > max_context) or tool_calls_num > domain_cfg.max_turns:
+            if tool_runner is not None:
+                tool_runner.cancel(last.tool_calls)
             return "end_cycle"
 
         # Default strategy: execute tools if tool calls exist, otherwise end cycle
         return "tools" if _has_tool_calls(last) else "end_cycle"
 
+    async def run_tools(state: WebCycleResearchState, config: RunnableConfig) -> Dict[str, Any]:
+        """Run the tool calls, collecting those already started while streaming"""
+        if tool_runner is None:
+            return await tool_node.ainvoke(state, config)
+        message = state["tool_input"][-1]
+
+        async def run_rest(calls: List[Any]) -> List[BaseMessage]:
+            out = await tool_node.ainvoke({"tool_input": [message.model_copy(update={"tool_calls": calls})]}, config)
+            return out["tool_input"]
+
+        return {"tool_input": await tool_runner.collect(message, run_rest)}
+
     def prep_tools(state: WebCycleResearchState) -> Dict[str, Any]:
         return {"tool_input": [state["messages"][-1]]}
 
@@ -128,29 +308,167 @@ def build_graph(cfg: dict) -> StateGraph:
         tool_msgs = state.get("tool_input", [])
         if not tool_msgs:
             return {"tool_input": []}
-        new_messages = list(state["messages"]) + list(tool_msgs)
-        return {"messages": new_messages, "tool_input": []}
+        tool_msgs = token_counter.fit_tool_messages(
+            state["messages"], list(tool_msgs),
+            domain_cfg.model.max_context_length, domain_cfg.model.max_tool_message_tokens,
+        )
+        return {
+            "messages": tool_msgs,
+            "tool_input": [],
+            "tool_calls_num": state.get("tool_calls_num", 0) + len(tool_msgs),
+            "context_tokens": token_counter.context_tokens(state["messages"]) + sum(token_counter.count(m) for m in tool_msgs),
+        }
+
+    def preflight(state: WebCycleResearchState) -> Literal["llm", "end_cycle"]:
+        """End the rollout before sending a request that would not leave room for another turn"""
+        max_context = domain_cfg.model.max_context_length
+        if max_context is None:
+            return "llm"
+        projected = state.get("context_tokens", 0)
+        if projected + MIN_TURN_BUDGET_TOKENS > max_context:
+            logger.info("Projected context %d tokens is near the %d limit, ending cycle", projected, max_context)
+            return "end_cycle"
+        return "llm"
+
+    async def check_convergence(state: WebCycleResearchState) -> Dict[str, Any]:
+        """Track the current answer across cycles and stop once it has been stable long enough"""
+        details = state["process_details"]
+        patch: Dict[str, Any] = {"process_details": details}
+        # before anything else: an expired deadline is also the usual reason the summary just failed
+        left = remaining_time()
+        if not state.get("stop_reason") and left is not None and left <= 0:
+            patch["stop_reason"] = "question time budget exhausted"
+            return patch
+        if state.get("stop_reason") or not convergence_cfg.enabled:
+            return patch
+        answers = [_current_answer(_history_text(h)) for h in state["cycle_histories"]]
+        details['current_answers'] = answers
+        if len(answers) < max(convergence_cfg.min_cycles, convergence_cfg.stable_cycles) or len(answers) >= domain_cfg.max_cycles:
+            return patch
+
+        recent = answers[-convergence_cfg.stable_cycles:]
+        if any(a is None for a in recent) or len({_normalize_answer(a) for a in recent}) != 1:
+            return patch
+
+        reason = f"current answer unchanged for {convergence_cfg.stable_cycles} cycles"
+        if verifier_node is not None:
+            prompt = convergence_cfg.verifier_prompt.format(
+                input=state["question"], answer=recent[-1], summary=_history_text(state["cycle_histories"][-1]),
+            )
+            verdict = await verifier_node({'messages': [HumanMessage(content=prompt)]})
+            text = _strip_think(verdict['messages'][-1].text) if verdict.get('messages') else ""
+            details.setdefault('verifier', []).append({'cycle': len(answers), 'answer': recent[-1], 'verdict': text})
+            if not text.strip().upper().startswith("YES"):
+                return patch
+            reason += " and confirmed by verifier"
+        patch["stop_reason"] = reason
+        return patch
 
     def final(state: WebCycleResearchState) -> Dict[str, Any]:
-        return {"output": state["messages"][-1].text}
+        state["process_details"]['stop_reason'] = state.get("stop_reason") or f"reached max_cycles ({domain_cfg.max_cycles})"
+        state["process_details"]['prompt_cache'] = merge_prompt_cache_usage(
+            rollout.get('prompt_cache') or prompt_cache_usage(rollout.get('messages', []))
+            for rollout in state["process_details"]['rollouts']
+        )
+        return {"output": state["messages"][-1].text, "process_details": state["process_details"]}
+
+    def add_rollout_nodes(graph: StateGraph, on_end: str) -> None:
+        graph.add_node("llm", traced_node("llm", recorded(llm_node)))
+        graph.add_node("tools", traced_node("tools", run_tools))
+        graph.add_node("tools_prep", prep_tools)
+        graph.add_node("tools_merge", traced_node("tools_merge", recorded(merge_tool_output)))
+        graph.add_conditional_edges("llm", decide, {"tools": "tools_prep", "end_cycle": on_end})
+        graph.add_edge("tools_prep", "tools")
+        graph.add_edge("tools", "tools_merge")
+        graph.add_conditional_edges("tools_merge", preflight, {"llm": "llm", "end_cycle": on_end})
 
     g.add_node("init_graph", init_graph)
-    g.add_node("llm", llm_node)
-    g.add_node("tools", tool_node)
-    g.add_node("start_cycle", start_cycle)
-    g.add_node("tools_prep", prep_tools)
-    g.add_node("end_cycle", end_cycle)
-    g.add_node("tools_merge", merge_tool_output)
+    g.add_node("start_cycle", traced_node("start_cycle", start_cycle))
+    g.add_node("convergence", traced_node("convergence", check_convergence))
     g.add_node("final", final)
-
     g.set_entry_point("init_graph")
     g.add_edge("init_graph", "start_cycle")
-    g.add_edge("start_cycle", "llm")
-    g.add_conditional_edges("llm", decide, {"tools": "tools_prep", "end_cycle": "end_cycle"})
-    g.add_edge("tools_prep", "tools")
-    g.add_edge("tools", "tools_merge")
-    g.add_edge("tools_merge", "llm")
-    g.add_conditional_edges("end_cycle", cycle_check, {"final": "final", "start_cycle": "start_cycle"})
+    g.add_conditional_edges("convergence", cycle_check, {"final": "final", "start_cycle": "start_cycle"})
     g.add_edge("final", END)
 
+    if domain_cfg.rollouts_per_cycle == 1:
+        add_rollout_nodes(g, on_end="end_cycle")
+        g.add_node("end_cycle", traced_node("end_cycle", end_cycle))
+        g.add_edge("start_cycle", "llm")
+        g.add_edge("end_cycle", "convergence")
+        return g
+
+    # K rollouts per cycle: each runs the llm/tools loop as an independent subgraph
+    rollout_graph = StateGraph(WebCycleResearchState)
+    add_rollout_nodes(rollout_graph, on_end=END)
+    rollout_graph.set_entry_point("llm")
+    rollout_app = rollout_graph.compile(checkpointer=False)
+
+    async def parallel_rollouts(state: WebCycleResearchState, config: RunnableConfig) -> Dict[str, Any]:
+        """Run rollouts_per_cycle rollouts from the same starting messages and fuse their summaries"""
+        sub_config = {"recursion_limit": config.get("recursion_limit", 10000)}
+        cycle = len(state["cycle_histories"])
+
+        async def one_rollout(index: int) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+            ref = begin_rollout(state["messages"], state["question"], cycle, index)
+            try:
+                rollout = await rollout_app.ainvoke(
+                    {
+                        "messages": state["messages"], "tool_input": [], "error": [], "tool_calls_num": 0,
+                        "prompt_cache_key": state.get("prompt_cache_key"), "rollout_ref": ref,
+                    },
+                    config=sub_config,
+                )
+                summary = await summarize_rollout(rollout["messages"], state["question"], state.get("prompt_cache_key"))
+                if not summary.get("messages"):
+                    raise RuntimeError(f"Rollout summary failed: {summary.get('error')}")
+            except BaseException:
+                if ref is not None:
+                    recorder.end(ref)
+                raise
+            entry = rollout_entry(summary["messages"], ref, len(summary["messages"]) - len(rollout["messages"]), cycle=cycle, rollout=index)
+            return (summary["messages"][-1:] if 'trajectory' in entry else summary["messages"]), entry
+
+        results = await asyncio.gather(*[one_rollout(i) for i in range(domain_cfg.rollouts_per_cycle)], return_exceptions=True)
+        completed = []
+        for r in results:
+            if isinstance(r, BaseException):
+                logger.error("Parallel rollout failed: %s", r)
+                continue
+            rollout_messages, entry = r
+            completed.append(rollout_messages)
+            state["process_details"]['rollouts'].append(entry)
+        if not completed:
+            raise results[0]
+
+        summaries = [rollout_messages[-1] for rollout_messages in completed]
+        texts = [_strip_think(m.text) for m in summaries]
+        answers = [_current_answer(t) for t in texts]
+        agreed = (
+            len(completed) > 1
+            and all(a is not None for a in answers)
+            and len({_normalize_answer(a) for a in answers}) == 1
+        )
+
+        patch: Dict[str, Any] = {}
+        if agreed and domain_cfg.early_exit_on_agreement:
+            messages = completed[0]
+            patch["stop_reason"] = f"{len(completed)} parallel rollouts agreed on the current answer"
+        else:
+            joined = "\n\n".join(f"### Attempt {i + 1}\n{t}" for i, t in enumerate(texts))
+            fusion_prompt = domain_cfg.fusion_prompt.format(input=state["question"], num_summaries=len(texts), summaries=joined)
+            fusion = await invoke_llm([HumanMessage(content=fusion_prompt)], state.get("prompt_cache_key"))
+            messages = fusion.get('messages') or completed[0]
+        state["process_details"].setdefault('fusions', []).append({'cycle': cycle, 'answers': answers, 'summary': messages[-1].text})
+
+        patch.update({
+            "cycle_histories": state["cycle_histories"] + [[messages[-1]]],
+            "process_details": state["process_details"],
+            "messages": ResetMessages(messages),
+        })
+        return patch
+
+    g.add_node("rollouts", traced_node("rollouts", parallel_rollouts))
+    g.add_edge("start_cycle", "rollouts")
+    g.add_edge("rollouts", "convergence")
     return g
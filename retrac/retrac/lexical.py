@@ -0,0 +1,65 @@
+from __future__ import annotations
+import math
+import re
+from collections import Counter
+from typing import List, Sequence
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# words, or single CJK characters (CJK text has no spaces to split on)
+_TERM_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]|[^\W_]+")
+
+
+def lexical_terms(text: str) -> List[str]:
+    return _TERM_RE.findall(text.lower())
+
+
+def split_chunks(text: str, max_chars: int) -> List[str]:
+    """Pack paragraphs greedily into chunks of at most max_chars characters"""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        while len(para) > max_chars:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            chunks.append(para[:max_chars])
+            para = para[max_chars:]
+        if size + len(para) > max_chars and current:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(para)
+        size += len(para) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def bm25_idf(docs: int, doc_freq: int) -> float:
+    return math.log(1 + (docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def bm25_term(idf: float, tf: int, length: int, avg_length: float, k1: float = BM25_K1, b: float = BM25_B) -> float:
+    """One query term's contribution to a document's BM25 score"""
+    return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+
+
+def score_chunks(chunks: Sequence[str], query: str, k1: float = BM25_K1, b: float = BM25_B) -> List[float]:
+    """BM25 relevance of each chunk to the query"""
+    docs = [Counter(lexical_terms(c)) for c in chunks]
+    if not docs:
+        return []
+    avg_len = sum(sum(d.values()) for d in docs) / len(docs) or 1.0
+    terms = set(lexical_terms(query))
+    df = Counter(term for d in docs for term in terms if term in d)
+    idf = {term: bm25_idf(len(docs), n) for term, n in df.items()}
+    scores = []
+    for d in docs:
+        length = sum(d.values())
+        scores.append(sum((bm25_term(weight, d[term], length, avg_len, k1, b) for term, weight in idf.items() if d.get(term)), 0.0))
+    return scores
@@ -0,0 +1,234 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Set
+from .cache import normalize_url
+from .tracing import record
+
+logger = logging.getLogger(__name__)
+
+# top search results per query fetched ahead of visit; 0 disables prefetching
+PREFETCH_TOP_K = int(os.getenv("PREFETCH_TOP_K", 0))
+PREFETCH_MAX_CONCURRENCY = int(os.getenv("PREFETCH_MAX_CONCURRENCY", 4))
+# average download rate of prefetches in bytes per second; 0 disables the cap
+PREFETCH_MAX_BYTES_PER_S = float(os.getenv("PREFETCH_MAX_BYTES_PER_S", 0))
+# prefetched pages held until visited; the oldest are dropped beyond this size or age
+PREFETCH_CACHE_MAX_BYTES = int(os.getenv("PREFETCH_CACHE_MAX_BYTES", 64 * 1024 ** 2))
+PREFETCH_TTL_S = float(os.getenv("PREFETCH_TTL_S", 600))
+# prefetches waiting for a slot; beyond this new ones are skipped
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", 64))
+
+
+@dataclass
+class _Page:
+    text: str
+    size: int
+    fetched: float
+
+
+class PagePrefetcher:
+    """Fetches likely-visited pages in the background into a bounded in-memory cache that visit reads first.
+
+    A visit of a prefetched page is a hit (or joins the fetch still in flight); a prefetched page that
+    expires or is evicted before it is visited is a wasted fetch. A prefetch still waiting for a slot
+    when its URL is visited is cancelled, so visit never queues behind prefetches.
+    """
+
+    def __init__(
+        self,
+        top_k: int = PREFETCH_TOP_K,
+        max_concurrency: int = PREFETCH_MAX_CONCURRENCY,
+        max_bytes_per_s: float = PREFETCH_MAX_BYTES_PER_S,
+        max_bytes: int = PREFETCH_CACHE_MAX_BYTES,
+        ttl_s: float = PREFETCH_TTL_S,
+        max_pending: int = PREFETCH_MAX_PENDING,
+    ) -> None:
+        self.top_k = top_k
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_bytes_per_s = max_bytes_per_s
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.max_pending = max_pending
+        self._pages: OrderedDict[str, _Page] = OrderedDict()
+        self._bytes = 0
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._started: Set[str] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._next_start = 0.0
+        self.stats = {
+            "scheduled": 0, "skipped": 0, "cancelled": 0, "fetched": 0, "failed": 0, "bytes": 0,
+            "hits": 0, "joined": 0, "misses": 0, "wasted": 0, "wasted_bytes": 0,
+        }
+
+    def _bind_loop(self) -> None:
+        # tasks and the semaphore belong to one event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._tasks.clear()
+            self._started.clear()
+            self._next_start = 0.0
+
+    def _waste(self, page: _Page) -> None:
+        self._bytes -= page.size
+        self.stats["wasted"] += 1
+        self.stats["wasted_bytes"] += page.size
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl_s
+        while self._pages:
+            key, page = next(iter(self._pages.items()))
+            if page.fetched >= cutoff:
+                break
+            del self._pages[key]
+            self._waste(page)
+
+    def _store(self, key: str, page: _Page) -> None:
+        if page.size > self.max_bytes:
+            self.stats["wasted"] += 1
+            self.stats["wasted_bytes"] += page.size
+            return
+        old = self._pages.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._pages[key] = page
+        self._bytes += page.size
+        while self._bytes > self.max_bytes:
+            self._waste(self._pages.popitem(last=False)[1])
+
+    async def _pace(self) -> None:
+        delay = self._next_start - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _prefetch(self, key: str, url: str, fetch: Callable[[str], Awaitable[Any]]) -> str | None:
+        assert self._slots is not None
+        async with self._slots:
+            self._started.add(key)
+            if self.max_bytes_per_s:
+                await self._pace()
+            try:
+                text = await fetch(url)
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.debug("Prefetching %s failed: %s", url, e)
+                return None
+        text = text if isinstance(text, str) else str(text)
+        size = len(text.encode("utf-8"))
+        self.stats["fetched"] += 1
+        self.stats["bytes"] += size
+        if self.max_bytes_per_s:
+            self._next_start = max(self._next_start, time.monotonic()) + size / self.max_bytes_per_s
+        self._store(key, _Page(text, size, time.monotonic()))
+        return text
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        self._started.discard(key)
+        if not task.cancelled():
+            task.exception()
+
+    def schedule(self, urls: Iterable[str], fetch: Callable[[str], Awaitable[Any]]) -> int:
+        """Start background fetches of urls not already held or in flight; returns how many were started"""
+        self._bind_loop()
+        self._expire()
+        started = 0
+        for url in urls:
+            key = normalize_url(url)
+            if key in self._pages or key in self._tasks:
+                continue
+            if len(self._tasks) - len(self._started) >= self.max_pending:
+                self.stats["skipped"] += 1
+                continue
+            task = asyncio.ensure_future(self._prefetch(key, url, fetch))
+            self._tasks[key] = task
+            task.add_done_callback(lambda t, key=key: self._done(key, t))
+            started += 1
+        self.stats["scheduled"] += started
+        return started
+
+    async def take(self, url: str) -> str | None:
+        """The prefetched page for url, joining its fetch when in flight; None when visit must fetch it"""
+        self._bind_loop()
+        self._expire()
+        key = normalize_url(url)
+        task = self._tasks.get(key)
+        if task is not None and key not in self._started:
+            del self._tasks[key]
+            task.cancel()
+            self.stats["cancelled"] += 1
+        elif task is not None:
+            text = await asyncio.shield(task)
+            if text is not None:
+                page = self._pages.pop(key, None)
+                if page is not None:
+                    self._bytes -= page.size
+                self.stats["joined"] += 1
+                record("prefetch_hits")
+                return text
+        else:
+            page = self._pages.pop(key, None)
+            if page is not None:
+                self._bytes -= page.size
+                self.stats["hits"] += 1
+                record("prefetch_hits")
+                return page.text
+        self.stats["misses"] += 1
+        record("prefetch_misses")
+        return None
+
+    def report(self) -> Dict[str, Any]:
+        served = self.stats["hits"] + self.stats["joined"]
+        requests = served + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(served / requests, 4) if requests else None,
+            "in_flight": len(self._tasks),
+            "held": len(self._pages),
+            "held_bytes": self._bytes,
+        }
+
+    async def aclose(self) -> None:
+        """Cancel prefetches still running or queued"""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        self._started.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_prefetcher: PagePrefetcher | None = None
+
+
+def get_page_prefetcher() -> PagePrefetcher | None:
+    """Return the process-wide prefetcher, or None when PREFETCH_TOP_K is 0"""
+    global _prefetcher
+    if _prefetcher is None and PREFETCH_TOP_K > 0:
+        _prefetcher = PagePrefetcher()
+    return _prefetcher
+
+
+def prefetch_stats() -> Dict[str, Any]:
+    return _prefetcher.report() if _prefetcher is not None else {}
+
+
+async def aclose_page_prefetcher() -> None:
+    """Stop outstanding prefetches and log how well prefetching did"""
+    if _prefetcher is None:
+        return
+    if _prefetcher._loop is asyncio.get_running_loop():
+        await _prefetcher.aclose()
+    report = _prefetcher.report()
+    if report["scheduled"]:
+        logger.info(
+            "Page prefetch: %d fetched, hit rate %s, %d wasted (%d bytes)",
+            report["fetched"], report["hit_rate"], report["wasted"] + report["held"], report["wasted_bytes"] + report["held_bytes"],
+        )
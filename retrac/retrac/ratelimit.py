@@ -0,0 +1,348 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict
+from .tracing import record
+
+logger = logging.getLogger(__name__)
+
+# memory | file:///path/to/dir | redis://host:port/db
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# lease after which a slot held by a crashed process is reclaimed
+CONCURRENCY_LEASE_S = float(os.getenv("CONCURRENCY_LEASE_S", 600))
+CONCURRENCY_POLL_S = 0.05
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of blocking.
+
+    A reservation may drive the balance negative; later callers then wait for the
+    debt to refill, which keeps waiters in arrival order without holding a lock
+    while sleeping.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount tokens and return the seconds to wait before using them"""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - amount)
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class LimiterBackend:
+    """Storage for token buckets and concurrency slots shared by all limiters"""
+
+    async def take(self, key: str, rate: float, capacity: float, amount: float) -> float:
+        """Atomically take amount tokens (negative refunds) and return the seconds to wait"""
+        raise NotImplementedError
+
+    async def try_acquire_slot(self, key: str, limit: int, holder: str, lease_s: float) -> bool:
+        raise NotImplementedError
+
+    async def release_slot(self, key: str, holder: str) -> None:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        pass
+
+
+class MemoryBackend(LimiterBackend):
+    """Per-process backend; the default when only one worker talks to an endpoint"""
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._slots: Dict[str, set] = {}
+
+    async def take(self, key: str, rate: float, capacity: float, amount: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity)
+        return bucket.reserve(amount)
+
+    async def try_acquire_slot(self, key: str, limit: int, holder: str, lease_s: float) -> bool:
+        holders = self._slots.setdefault(key, set())
+        if len(holders) >= limit:
+            return False
+        holders.add(holder)
+        return True
+
+    async def release_slot(self, key: str, holder: str) -> None:
+        self._slots.get(key, set()).discard(holder)
+
+
+class FileBackend(LimiterBackend):
+    """Backend shared by processes on one host through flock-guarded state files"""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    @contextlib.contextmanager
+    def _locked(self, key: str):
+        with open(self._path(key), "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                state = json.loads(raw) if raw else {}
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _take(self, key: str, rate: float, capacity: float, amount: float) -> float:
+        now = time.time()
+        with self._locked(key) as state:
+            tokens = state.get("tokens", capacity)
+            tokens += (now - state.get("updated", now)) * rate
+            tokens = min(capacity, min(capacity, tokens) - amount)
+            state["tokens"], state["updated"] = tokens, now
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+    def _try_acquire_slot(self, key: str, limit: int, holder: str, lease_s: float) -> bool:
+        now = time.time()
+        with self._locked(key) as state:
+            holders = {h: exp for h, exp in state.get("holders", {}).items() if exp > now}
+            acquired = len(holders) < limit
+            if acquired:
+                holders[holder] = now + lease_s
+            state["holders"] = holders
+        return acquired
+
+    def _release_slot(self, key: str, holder: str) -> None:
+        with self._locked(key) as state:
+            state.get("holders", {}).pop(holder, None)
+
+    async def take(self, key: str, rate: float, capacity: float, amount: float) -> float:
+        return await asyncio.to_thread(self._take, key, rate, capacity, amount)
+
+    async def try_acquire_slot(self, key: str, limit: int, holder: str, lease_s: float) -> bool:
+        return await asyncio.to_thread(self._try_acquire_slot, key, limit, holder, lease_s)
+
+    async def release_slot(self, key: str, holder: str) -> None:
+        await asyncio.to_thread(self._release_slot, key, holder)
+
+
+_REDIS_TAKE = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, math.min(capacity, tokens + (now - updated) * rate) - amount)
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity - math.min(tokens, 0)) / rate) + 60)
+if tokens >= 0 then return '0' end
+return tostring(-tokens / rate)
+"""
+
+_REDIS_ACQUIRE_SLOT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then return 0 end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[2])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])) + 60)
+return 1
+"""
+
+
+class RedisBackend(LimiterBackend):
+    """Backend shared across hosts; accepts any client exposing async eval/zrem"""
+
+    def __init__(self, client: Any = None, url: str | None = None, prefix: str = "retrac:ratelimit:") -> None:
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    async def take(self, key: str, rate: float, capacity: float, amount: float) -> float:
+        wait = await self.client.eval(_REDIS_TAKE, 1, self.prefix + key, rate, capacity, amount)
+        return float(wait)
+
+    async def try_acquire_slot(self, key: str, limit: int, holder: str, lease_s: float) -> bool:
+        acquired = await self.client.eval(_REDIS_ACQUIRE_SLOT, 1, self.prefix + key, limit, holder, lease_s)
+        return bool(int(acquired))
+
+    async def release_slot(self, key: str, holder: str) -> None:
+        await self.client.zrem(self.prefix + key, holder)
+
+    async def aclose(self) -> None:
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+
+def create_limiter_backend(spec: str) -> LimiterBackend:
+    """Build a backend from a RATE_LIMIT_BACKEND style spec"""
+    if spec in ("", "memory"):
+        return MemoryBackend()
+    if spec.startswith("file://"):
+        return FileBackend(spec[len("file://"):])
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url=spec)
+    raise ValueError(f"Unknown rate limit backend '{spec}'")
+
+
+_limiter_backend: LimiterBackend | None = None
+
+
+def get_limiter_backend() -> LimiterBackend:
+    """Return the process-wide limiter backend, configured from RATE_LIMIT_BACKEND"""
+    global _limiter_backend
+    if _limiter_backend is None:
+        _limiter_backend = create_limiter_backend(RATE_LIMIT_BACKEND)
+    return _limiter_backend
+
+
+def set_limiter_backend(backend: LimiterBackend) -> None:
+    """Install a custom backend, e.g. a local Redis stand-in in tests"""
+    global _limiter_backend
+    _limiter_backend = backend
+
+
+class RateLimiter:
+    """Requests/sec, tokens/min and in-flight budgets for one endpoint"""
+
+    def __init__(
+        self,
+        name: str,
+        qps: float | None = None,
+        tpm: float | None = None,
+        max_concurrency: int | None = None,
+        backend: LimiterBackend | None = None,
+    ) -> None:
+        self.name = name
+        self.qps = qps
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self._backend = backend
+        self.stats: Dict[str, float] = {
+            "requests": 0,
+            "tokens": 0,
+            "waits": 0,
+            "wait_s_total": 0.0,
+            "wait_s_max": 0.0,
+        }
+
+    @property
+    def backend(self) -> LimiterBackend:
+        return self._backend or get_limiter_backend()
+
+    def override(self, qps: float | None = None, tpm: float | None = None, max_concurrency: int | None = None) -> None:
+        """Replace the limits that are given, keeping the others"""
+        if qps is not None:
+            self.qps = qps
+        if tpm is not None:
+            self.tpm = tpm
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+
+    def _record_wait(self, wait: float) -> None:
+        if wait > 0:
+            record("rate_limit_wait_s", wait)
+            self.stats["waits"] += 1
+            self.stats["wait_s_total"] += wait
+            self.stats["wait_s_max"] = max(self.stats["wait_s_max"], wait)
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait until one request and `tokens` estimated tokens fit the budget; returns the wait"""
+        wait = 0.0
+        if self.qps:
+            wait = max(wait, await self.backend.take(f"{self.name}:rps", self.qps, self.qps, 1))
+        if self.tpm and tokens:
+            wait = max(wait, await self.backend.take(f"{self.name}:tpm", self.tpm / 60.0, self.tpm, tokens))
+        self.stats["requests"] += 1
+        self.stats["tokens"] += tokens
+        self._record_wait(wait)
+        if wait > 0:
+            logger.debug("Rate limiter %s waiting %.3fs", self.name, wait)
+            await asyncio.sleep(wait)
+        return wait
+
+    async def settle(self, estimated: int, actual: int | None) -> None:
+        """Correct the token budget once the real usage of a request is known"""
+        if not self.tpm or actual is None or actual == estimated:
+            return
+        await self.backend.take(f"{self.name}:tpm", self.tpm / 60.0, self.tpm, actual - estimated)
+        self.stats["tokens"] += actual - estimated
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one of max_concurrency in-flight slots shared by every process on the backend"""
+        if not self.max_concurrency:
+            yield
+            return
+        holder = f"{os.getpid()}:{uuid.uuid4().hex}"
+        key = f"{self.name}:inflight"
+        start = time.monotonic()
+        while not await self.backend.try_acquire_slot(key, self.max_concurrency, holder, CONCURRENCY_LEASE_S):
+            await asyncio.sleep(CONCURRENCY_POLL_S)
+        self._record_wait(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            await self.backend.release_slot(key, holder)
+
+    @contextlib.asynccontextmanager
+    async def limit(self, tokens: int = 0) -> AsyncIterator[None]:
+        """Acquire rate budget and an in-flight slot for one request"""
+        await self.acquire(tokens)
+        async with self.slot():
+            yield
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(
+    endpoint: str | None,
+    qps: float | None = None,
+    tpm: float | None = None,
+    max_concurrency: int | None = None,
+) -> RateLimiter:
+    """Return the shared limiter for an endpoint; each limit is fixed by the first caller that sets it"""
+    name = endpoint or "default"
+    limiter = _rate_limiters.get(name)
+    if limiter is None:
+        limiter = RateLimiter(name, qps=qps, tpm=tpm, max_concurrency=max_concurrency)
+        _rate_limiters[name] = limiter
+    else:
+        limiter.override(
+            qps=qps if limiter.qps is None else None,
+            tpm=tpm if limiter.tpm is None else None,
+            max_concurrency=max_concurrency if limiter.max_concurrency is None else None,
+        )
+    return limiter
+
+
+def rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Wait-time and usage counters for every endpoint limiter in this process"""
+    return {name: dict(limiter.stats) for name, limiter in _rate_limiters.items()}
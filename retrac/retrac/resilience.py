@@ -0,0 +1,248 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, TypeVar
+from .tracing import record, span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# tool calls (search/browse/summarize); LLM retries are configured in components
+TOOL_RETRY_ATTEMPTS = int(os.getenv("TOOL_RETRY_ATTEMPTS", 4))
+TOOL_RETRY_BASE_DELAY_S = float(os.getenv("TOOL_RETRY_BASE_DELAY_S", 0.5))
+TOOL_RETRY_MAX_DELAY_S = float(os.getenv("TOOL_RETRY_MAX_DELAY_S", 20))
+# consecutive transient failures that open an endpoint's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 8))
+CIRCUIT_RESET_S = float(os.getenv("CIRCUIT_RESET_S", 30))
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The question's time budget ran out before the request could be (re)sent"""
+
+
+class CircuitOpenError(Exception):
+    """The endpoint's circuit is open after repeated failures; retry_after says when it half-opens"""
+
+    def __init__(self, endpoint: str, retry_after: float) -> None:
+        super().__init__(f"circuit open for {endpoint}, retry in {retry_after:.1f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+# absolute time.monotonic() deadline of the question being run in this context
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("retrac_deadline", default=None)
+
+
+@contextlib.contextmanager
+def deadline_scope(timeout_s: float | None) -> Iterator[None]:
+    """Bound every request made in this context (and tasks it spawns) by timeout_s from now"""
+    if timeout_s is None:
+        yield
+        return
+    current = _deadline.get()
+    deadline = time.monotonic() + timeout_s
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> float | None:
+    """Seconds left in the current deadline scope, or None when unbounded"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def error_status(exc: BaseException) -> int | None:
+    """HTTP status of an aiohttp, httpx or openai error, if it carries one"""
+    for attr in ("status", "status_code"):
+        status = getattr(exc, attr, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Transient failures: 408/409/425/429/5xx, timeouts, dropped connections and open circuits"""
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if isinstance(exc, (CircuitOpenError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = error_status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    name = type(exc).__name__
+    # aiohttp.ClientConnectionError/ServerDisconnectedError, httpx.TransportError, openai.APIConnectionError/APITimeoutError
+    return any(marker in name for marker in ("Connection", "Disconnected", "Timeout", "Transport"))
+
+
+def retry_after(exc: BaseException) -> float | None:
+    """Seconds the server asked us to wait (Retry-After as seconds or HTTP date)"""
+    if isinstance(exc, CircuitOpenError):
+        return exc.retry_after
+    headers = getattr(exc, "headers", None) or getattr(getattr(exc, "response", None), "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter, never shorter than the server's Retry-After"""
+    attempts: int = TOOL_RETRY_ATTEMPTS
+    base_delay_s: float = TOOL_RETRY_BASE_DELAY_S
+    max_delay_s: float = TOOL_RETRY_MAX_DELAY_S
+
+    def delay(self, attempt: int, exc: BaseException | None = None) -> float:
+        delay = random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2 ** attempt))
+        hinted = retry_after(exc) if exc is not None else None
+        return max(delay, hinted) if hinted is not None else delay
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker: opens after consecutive transient failures, lets one probe through after reset_s"""
+
+    def __init__(self, endpoint: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_s: float = CIRCUIT_RESET_S) -> None:
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self.stats: Dict[str, Any] = {"attempts": 0, "retries": 0, "failures": 0, "opens": 0, "rejected": 0, "retry_wait_s": 0.0}
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.reset_s else "open"
+
+    def before(self) -> None:
+        """Raise CircuitOpenError unless a request may be sent now"""
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        self.stats["rejected"] += 1
+        wait = self.reset_s - (time.monotonic() - self._opened_at) if state == "open" else 1.0
+        raise CircuitOpenError(self.endpoint, max(wait, 0.0))
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("Circuit for %s closed", self.endpoint)
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def release_probe(self) -> None:
+        """The half-open probe ended without a verdict (e.g. it was cancelled)"""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.stats["failures"] += 1
+        self._failures += 1
+        if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+            if self._opened_at is None:
+                logger.warning("Circuit for %s opened after %d consecutive failures", self.endpoint, self._failures)
+            self.stats["opens"] += 1
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(endpoint: str | None) -> CircuitBreaker:
+    """Return the shared breaker for an endpoint"""
+    name = endpoint or "default"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def resilience_stats() -> Dict[str, Dict[str, Any]]:
+    """Retry and circuit counters for every endpoint in this process"""
+    return {name: {**breaker.stats, "state": breaker.state} for name, breaker in _breakers.items()}
+
+
+def backoff_within_deadline(delay: float) -> float:
+    """Delay to sleep before the next attempt; raise if it would outlive the deadline"""
+    left = remaining_time()
+    if left is not None and delay >= left:
+        raise DeadlineExceeded(f"no time left to retry (needs {delay:.1f}s, {max(left, 0):.1f}s remaining)")
+    return delay
+
+
+async def with_deadline(call: Awaitable[T]) -> T:
+    """Await call bounded by the remaining question budget"""
+    left = remaining_time()
+    if left is None:
+        return await call
+    if left <= 0:
+        if asyncio.iscoroutine(call):
+            call.close()
+        raise DeadlineExceeded("question deadline exceeded")
+    try:
+        return await asyncio.wait_for(call, left)
+    except asyncio.TimeoutError as e:
+        raise DeadlineExceeded("question deadline exceeded") from e
+
+
+async def retry_call(endpoint: str, fn: Callable[[], Awaitable[T]], policy: RetryPolicy | None = None) -> T:
+    """Call fn with retries on transient errors, behind the endpoint's circuit breaker and the question deadline"""
+    policy = policy or RetryPolicy()
+    breaker = get_circuit_breaker(endpoint)
+    for attempt in range(policy.attempts):
+        try:
+            with span(endpoint, kind="client", attempt=attempt):
+                breaker.before()
+                breaker.stats["attempts"] += 1
+                result = await with_deadline(fn())
+        except (asyncio.CancelledError, DeadlineExceeded):
+            # our budget ran out or the caller gave up, which says nothing about the endpoint
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                # the endpoint answered (e.g. 4xx) or the caller failed; neither says it is unhealthy
+                breaker.record_success()
+                raise
+            if not isinstance(e, CircuitOpenError):
+                breaker.record_failure()
+            if attempt == policy.attempts - 1:
+                raise
+            delay = backoff_within_deadline(policy.delay(attempt, e))
+            breaker.stats["retries"] += 1
+            breaker.stats["retry_wait_s"] += delay
+            record("retries")
+            record("retry_wait_s", delay)
+            logger.warning("%s failed (%s), retry %d/%d in %.1fs", endpoint, e, attempt + 1, policy.attempts - 1, delay)
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+    raise AssertionError("unreachable")
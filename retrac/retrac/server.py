@@ -0,0 +1,240 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import uuid
+from typing import Any, AsyncIterator, Dict
+from aiohttp import WSMsgType, web
+from .batch import to_jsonable
+from .cache import single_flight_stats, tool_cache_stats
+from .checkpoint import invoke_with_resume, open_checkpointer
+from .components import aclose_llm_clients, prompt_cache_stats
+from .config import load_config
+from .events import stream_question
+from .graph import build_graph
+from .prefetch import prefetch_stats
+from .resilience import resilience_stats
+from .transport import aclose_tool_transport
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """Every session slot is busy and the admission queue is full"""
+
+
+class AdmissionController:
+    """Runs at most max_active sessions at once and queues up to max_queued more; beyond that, rejects"""
+
+    def __init__(self, max_active: int, max_queued: int) -> None:
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self._slots = asyncio.Semaphore(max_active)
+        self.active = 0
+        self.queued = 0
+        self.stats = {"admitted": 0, "rejected": 0, "completed": 0}
+
+    @contextlib.asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        if self.active >= self.max_active and self.queued >= self.max_queued:
+            self.stats["rejected"] += 1
+            raise Overloaded(f"{self.active} sessions running, {self.queued} queued")
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+        self.stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.stats["completed"] += 1
+            self._slots.release()
+
+
+class AgentServer:
+    """Serves questions over HTTP from graphs compiled once, with LLM and tool clients kept open between sessions.
+
+    POST /v1/research        {"question", "thread_id"?, "config"?, "stream"?, "tokens"?}
+                             streams events as SSE, or returns the final event as JSON with "stream": false
+    GET  /v1/research/ws     websocket; each {"question", ...} message starts a session whose events
+                             carry its "session" id, {"cancel": session} stops one, many may run at once
+    GET  /healthz            sessions, admission, prompt cache, retry/circuit and page prefetch counters
+    """
+
+    def __init__(
+        self,
+        configs: Dict[str, str],
+        max_active: int = 32,
+        max_queued: int = 128,
+        run_config: Dict[str, Any] | None = None,
+        checkpoint_db: str | None = None,
+        checkpoint_every_tool_step: bool = False,
+    ) -> None:
+        if not configs:
+            raise ValueError("at least one graph config is required")
+        self.configs = configs
+        self.default_config = next(iter(configs))
+        self.admission = AdmissionController(max_active, max_queued)
+        # shared by every session: recursion_limit, configurable.question_timeout_s, ...
+        self.run_config = run_config or {"recursion_limit": int(os.getenv("RECURSION_LIMIT", "10000"))}
+        self.checkpoint_db = checkpoint_db
+        self.checkpoint_every_tool_step = checkpoint_every_tool_step
+        self.graphs: Dict[str, Any] = {}
+
+    async def _lifecycle(self, app: web.Application) -> AsyncIterator[None]:
+        async with open_checkpointer(self.checkpoint_db, self.checkpoint_every_tool_step) as checkpointer:
+            for name, path in self.configs.items():
+                self.graphs[name] = build_graph(load_config(path)).compile(checkpointer=checkpointer)
+                logger.info("Compiled graph %r from %s", name, path)
+            try:
+                yield
+            finally:
+                await aclose_llm_clients()
+                await aclose_tool_transport()
+
+    def _session_args(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        question = body.get("question")
+        if not isinstance(question, str) or not question.strip():
+            raise web.HTTPBadRequest(text="'question' is required")
+        name = body.get("config") or self.default_config
+        if name not in self.graphs:
+            raise web.HTTPBadRequest(text=f"unknown config {name!r}, available: {sorted(self.graphs)}")
+        return {
+            "app": self.graphs[name],
+            "question": question,
+            "run_config": self.run_config,
+            "thread_id": body.get("thread_id") or uuid.uuid4().hex,
+        }
+
+    @staticmethod
+    async def _write_sse(response: web.StreamResponse, event: Dict[str, Any]) -> None:
+        data = json.dumps(event, ensure_ascii=False, default=str)
+        await response.write(f"event: {event['event']}\ndata: {data}\n\n".encode())
+
+    async def research(self, request: web.Request) -> web.StreamResponse:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise web.HTTPBadRequest(text="request body must be JSON")
+        args = self._session_args(body)
+        try:
+            async with self.admission.admit():
+                if not body.get("stream", True):
+                    state = await invoke_with_resume(args["app"], args["question"], args["run_config"], args["thread_id"])
+                    return web.json_response({
+                        "thread_id": args["thread_id"], "output": state.get("output"),
+                        "error": state.get("error", []), "process_details": to_jsonable(state.get("process_details", {})),
+                    }, dumps=lambda obj: json.dumps(obj, ensure_ascii=False))
+
+                response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+                await response.prepare(request)
+                events = stream_question(**args, tokens=body.get("tokens", True))
+                try:
+                    # a client that disconnects makes write() raise, which closes the stream and stops the run
+                    async with contextlib.aclosing(events):
+                        async for event in events:
+                            await self._write_sse(response, event)
+                except ConnectionResetError:
+                    logger.info("Client disconnected, session %s stopped", args["thread_id"])
+                    return response
+                except Exception as e:
+                    logger.error("Session %s failed: %s", args["thread_id"], e, exc_info=True)
+                    await self._write_sse(response, {"event": "error", "thread_id": args["thread_id"], "error": f"{type(e).__name__}: {e}"})
+                await response.write_eof()
+                return response
+        except Overloaded as e:
+            raise web.HTTPServiceUnavailable(text=str(e), headers={"Retry-After": "1"})
+
+    async def research_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        sessions: Dict[str, asyncio.Task] = {}
+        send_lock = asyncio.Lock()
+
+        async def send(event: Dict[str, Any]) -> None:
+            async with send_lock:
+                await ws.send_str(json.dumps(event, ensure_ascii=False, default=str))
+
+        async def run(session: str, body: Dict[str, Any]) -> None:
+            try:
+                args = self._session_args(body)
+                async with self.admission.admit():
+                    events = stream_question(**args, tokens=body.get("tokens", True))
+                    async with contextlib.aclosing(events):
+                        async for event in events:
+                            await send({**event, "session": session})
+            except asyncio.CancelledError:
+                raise
+            except (web.HTTPBadRequest, Overloaded) as e:
+                await send({"event": "error", "session": session, "error": getattr(e, "text", None) or str(e)})
+            except Exception as e:
+                logger.error("Session %s failed: %s", session, e, exc_info=True)
+                await send({"event": "error", "session": session, "error": f"{type(e).__name__}: {e}"})
+            finally:
+                sessions.pop(session, None)
+
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    body = json.loads(msg.data)
+                except json.JSONDecodeError:
+                    await send({"event": "error", "error": "messages must be JSON"})
+                    continue
+                if "cancel" in body:
+                    task = sessions.get(str(body["cancel"]))
+                    if task is not None:
+                        task.cancel()
+                    continue
+                session = str(body.get("session") or uuid.uuid4().hex)
+                if session in sessions:
+                    await send({"event": "error", "session": session, "error": "session already running"})
+                    continue
+                sessions[session] = asyncio.create_task(run(session, body))
+        finally:
+            # the socket closed: stop whatever it was still running
+            for task in list(sessions.values()):
+                task.cancel()
+            await asyncio.gather(*sessions.values(), return_exceptions=True)
+        return ws
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "graphs": sorted(self.graphs),
+            "active": self.admission.active,
+            "queued": self.admission.queued,
+            "max_active": self.admission.max_active,
+            "max_queued": self.admission.max_queued,
+            "admission": self.admission.stats,
+            "prompt_cache": prompt_cache_stats(),
+            "resilience": resilience_stats(),
+            "prefetch": prefetch_stats(),
+            "tool_cache": tool_cache_stats(),
+            "single_flight": single_flight_stats(),
+        })
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.cleanup_ctx.append(self._lifecycle)
+        app.router.add_post("/v1/research", self.research)
+        app.router.add_get("/v1/research/ws", self.research_ws)
+        app.router.add_get("/healthz", self.health)
+        return app
+
+
+async def serve(server: AgentServer, host: str = "127.0.0.1", port: int = 8000) -> None:
+    """Run the server until cancelled"""
+    runner = web.AppRunner(server.app(), access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        logger.info("Serving on http://%s:%d", host, port)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import asyncio
+import glob
+import json
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List
+from .batch import completed_ids, question_id, result_record
+from .checkpoint import invoke_with_resume, open_checkpointer
+
+logger = logging.getLogger(__name__)
+
+EVENT_POLL_S = 1.0
+
+
+def _shard_path(output_path: str, worker_idx: int) -> str:
+    return f"{output_path}.shard{worker_idx}"
+
+
+def merge_shards(output_path: str) -> int:
+    """Append every complete line of the per-worker shard files to output_path and remove them"""
+    merged = 0
+    with open(output_path, "a", encoding="utf-8") as out:
+        for path in sorted(glob.glob(f"{glob.escape(output_path)}.shard*")):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn write from a crashed worker
+                    out.write(line if line.endswith("\n") else line + "\n")
+                    merged += 1
+            os.remove(path)
+    return merged
+
+
+async def _worker_loop(
+    worker_idx: int,
+    config_path: str,
+    shard_path: str,
+    task_q: Any,
+    event_q: Any,
+    concurrency: int,
+    run_config: Dict[str, Any],
+    checkpoint_db: str | None,
+    checkpoint_every_tool_step: bool,
+) -> None:
+    from .config import load_config
+    from .graph import build_graph
+    from .components import aclose_llm_clients
+    from .transport import aclose_tool_transport
+
+    write_lock = asyncio.Lock()
+    loop = asyncio.get_running_loop()
+    local_q: asyncio.Queue = asyncio.Queue()
+
+    def feed() -> None:
+        # one thread blocks on the process queue, so idle consumers hold no default-executor threads
+        stops = 0
+        while stops < concurrency:
+            record = task_q.get()
+            stops += record is None
+            try:
+                loop.call_soon_threadsafe(local_q.put_nowait, record)
+            except RuntimeError:  # loop closed
+                return
+
+    threading.Thread(target=feed, name=f"shard{worker_idx}-feeder", daemon=True).start()
+
+    async def consumer(app: Any, out: Any) -> None:
+        while True:
+            event_q.put(("ready", worker_idx, None, None))
+            record = await local_q.get()
+            if record is None:
+                return
+            start = time.monotonic()
+            state, error = None, None
+            try:
+                state = await invoke_with_resume(app, record["question"], run_config, question_id(record))
+            except Exception as e:
+                logger.error("Worker %d: question %s failed: %s", worker_idx, question_id(record), e, exc_info=True)
+                error = e
+            result = result_record(record, state, error, time.monotonic() - start)
+            async with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+            event_q.put(("done", worker_idx, question_id(record), result["status"]))
+
+    async with open_checkpointer(checkpoint_db, checkpoint_every_tool_step) as checkpointer:
+        app = build_graph(load_config(config_path)).compile(checkpointer=checkpointer)
+        with open(shard_path, "a+", encoding="utf-8") as out:
+            # a previous incarnation of this worker may have died mid-line
+            if out.tell() > 0:
+                out.seek(out.tell() - 1)
+                if out.read(1) != "\n":
+                    out.write("\n")
+            try:
+                await asyncio.gather(*[consumer(app, out) for _ in range(concurrency)])
+            finally:
+                await aclose_llm_clients()
+                await aclose_tool_transport()
+
+
+def _worker_main(*args: Any) -> None:
+    asyncio.run(_worker_loop(*args))
+
+
+def run_sharded(
+    config_path: str,
+    records: List[Dict[str, Any]],
+    output_path: str,
+    workers: int,
+    concurrency: int,
+    run_config: Dict[str, Any],
+    max_attempts: int = 2,
+    checkpoint_db: str | None = None,
+    checkpoint_every_tool_step: bool = False,
+) -> Dict[str, int]:
+    """Run questions across worker processes, handing each question to whichever worker has a free slot.
+
+    Questions held by a worker that dies are re-queued (up to max_attempts) and the
+    worker is replaced. Per-worker shard files are merged into output_path at the end.
+    """
+    merge_shards(output_path)  # leftovers from an interrupted run
+    done = completed_ids(output_path)
+    pending: Dict[str, Dict[str, Any]] = {question_id(r): r for r in records if question_id(r) not in done}
+    backlog: Deque[str] = deque(pending)
+    attempts: Dict[str, int] = {qid: 0 for qid in pending}
+    counts = {"done": 0, "failed": 0, "skipped": len(done), "requeued": 0}
+    logger.info("Sharded run: %d questions pending over %d workers", len(pending), workers)
+
+    ctx = mp.get_context("spawn")
+    event_q = ctx.Queue()
+    procs: Dict[int, Any] = {}
+    task_qs: Dict[int, Any] = {}
+    inflight: Dict[int, set] = {}
+    free_slots: Dict[int, int] = {}
+    respawns_left = workers * 3
+
+    def spawn(idx: int) -> None:
+        task_qs[idx] = ctx.Queue()
+        inflight[idx] = set()
+        free_slots[idx] = 0
+        procs[idx] = ctx.Process(
+            target=_worker_main,
+            args=(
+                idx, config_path, _shard_path(output_path, idx), task_qs[idx], event_q, concurrency,
+                run_config, checkpoint_db, checkpoint_every_tool_step,
+            ),
+            daemon=True,
+        )
+        procs[idx].start()
+
+    def dispatch() -> None:
+        for idx in procs:
+            while free_slots[idx] and backlog:
+                qid = backlog.popleft()
+                attempts[qid] += 1
+                inflight[idx].add(qid)
+                free_slots[idx] -= 1
+                task_qs[idx].put(pending[qid])
+
+    def fail(qid: str) -> None:
+        record = pending.pop(qid)
+        result = result_record(record, None, RuntimeError(f"worker crashed {attempts[qid]} times"), 0.0)
+        with open(output_path, "a", encoding="utf-8") as out:
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        counts["failed"] += 1
+
+    for idx in range(workers):
+        spawn(idx)
+
+    try:
+        while pending:
+            try:
+                kind, idx, qid, status = event_q.get(timeout=EVENT_POLL_S)
+            except queue.Empty:
+                kind = None
+            if kind == "ready":
+                free_slots[idx] += 1
+            elif kind == "done":
+                inflight[idx].discard(qid)
+                if pending.pop(qid, None) is not None:
+                    counts[status] += 1
+            # only reap dead workers once their last events have been drained
+            if kind is None or event_q.empty():
+                for dead in [i for i, p in procs.items() if not p.is_alive()]:
+                    logger.error("Worker %d exited with code %s; re-queueing %d questions", dead, procs[dead].exitcode, len(inflight[dead]))
+                    for lost in inflight[dead]:
+                        if lost not in pending:
+                            continue
+                        if attempts[lost] >= max_attempts:
+                            fail(lost)
+                        else:
+                            backlog.appendleft(lost)
+                            counts["requeued"] += 1
+                    if respawns_left <= 0:
+                        raise RuntimeError("Too many worker crashes, aborting sharded run")
+                    respawns_left -= 1
+                    spawn(dead)
+            dispatch()
+    finally:
+        for idx, proc in procs.items():
+            if proc.is_alive():
+                for _ in range(concurrency):
+                    task_qs[idx].put(None)
+        for proc in procs.values():
+            proc.join(timeout=60)
+            if proc.is_alive():
+                proc.terminate()
+        merge_shards(output_path)
+    return counts
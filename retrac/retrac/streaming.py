@@ -0,0 +1,147 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage, message_chunk_to_message
+from langchain_core.messages.ai import add_ai_message_chunks
+from langchain_core.messages.tool import ToolCall
+
+logger = logging.getLogger(__name__)
+
+FINISH_MARKER = "<tool_call>finish</tool_call>"
+TOOL_CALL_END = "</tool_call>"
+
+
+class MalformedToolCall(Exception):
+    """Raised when a streamed generation contains a tool call the server could not parse"""
+
+
+class ToolCallStreamParser:
+    """Accumulates streamed AIMessageChunks and reports each tool call once it is complete.
+
+    A native tool call is complete when a call with a higher index starts or the stream
+    ends. Raw `</tool_call>` text in the content means the server's tool parser failed,
+    which is reported as soon as it appears instead of after the full completion.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: List[AIMessageChunk] = []
+        # index -> {"name", "id", "args": [fragments]}
+        self._calls: Dict[int, Dict[str, Any]] = {}
+        self._emitted: set[int] = set()
+        self._tail = ""
+        self.finished = False
+
+    def _scan_text(self, text: str) -> None:
+        window = self._tail + text
+        if FINISH_MARKER in window:
+            self.finished = True
+        elif TOOL_CALL_END in window:
+            raise MalformedToolCall(f"unparsed tool call in generated text: ...{window[-200:]}")
+        self._tail = window[-len(FINISH_MARKER):]
+
+    def _complete(self, index: int) -> ToolCall:
+        call = self._calls[index]
+        raw = "".join(call["args"])
+        try:
+            args = json.loads(raw) if raw.strip() else {}
+        except json.JSONDecodeError as e:
+            raise MalformedToolCall(f"tool call {call['name']!r} has invalid JSON arguments: {raw[:200]}") from e
+        self._emitted.add(index)
+        return ToolCall(name=call["name"], args=args, id=call["id"])
+
+    def feed(self, chunk: AIMessageChunk) -> List[ToolCall]:
+        """Add a chunk; return the tool calls it completed"""
+        self._chunks.append(chunk)
+        if isinstance(chunk.content, str) and chunk.content:
+            self._scan_text(chunk.content)
+        started = []
+        for tc in chunk.tool_call_chunks or []:
+            index = tc.get("index") or 0
+            call = self._calls.get(index)
+            if call is None:
+                call = self._calls[index] = {"name": "", "id": None, "args": []}
+                started.append(index)
+            call["name"] += tc.get("name") or ""
+            call["id"] = call["id"] or tc.get("id")
+            if tc.get("args"):
+                call["args"].append(tc["args"])
+        completed = []
+        if started:
+            newest = max(started)
+            for index in sorted(self._calls):
+                if index < newest and index not in self._emitted:
+                    completed.append(self._complete(index))
+        return completed
+
+    def close(self) -> List[ToolCall]:
+        """End of stream: every call not yet reported is complete"""
+        return [self._complete(i) for i in sorted(self._calls) if i not in self._emitted]
+
+    def message(self) -> AIMessage:
+        """The full response assembled from the chunks received so far"""
+        if not self._chunks:
+            return AIMessage(content="")
+        merged = add_ai_message_chunks(self._chunks[0], *self._chunks[1:]) if len(self._chunks) > 1 else self._chunks[0]
+        return message_chunk_to_message(merged)
+
+
+class EarlyToolRunner:
+    """Starts tool calls while the LLM is still generating and hands their results to the tools step.
+
+    Tasks are keyed by tool call id, so one runner can be shared by concurrent questions.
+    """
+
+    def __init__(self, tools: Iterable[Any]) -> None:
+        self._tools = {getattr(t, "name", None): t for t in tools}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.used = 0
+        self.cancelled = 0
+
+    def start(self, call: ToolCall) -> None:
+        tool = self._tools.get(call["name"])
+        if tool is None or not call.get("id") or call["id"] in self._tasks:
+            return
+        self._tasks[call["id"]] = asyncio.create_task(tool.ainvoke({**call, "type": "tool_call"}))
+        self.started += 1
+
+    def cancel(self, calls: Sequence[ToolCall]) -> None:
+        """Drop early results that will never be used (aborted generation or cycle ended)"""
+        for call in calls:
+            task = self._tasks.pop(call.get("id") or "", None)
+            if task is not None:
+                task.cancel()
+                self.cancelled += 1
+
+    async def _result(self, call: ToolCall, task: asyncio.Task) -> ToolMessage:
+        try:
+            result = await task
+        except Exception as e:
+            return ToolMessage(
+                content=f"Error: {e!r}\n Please fix your mistakes.", tool_call_id=call["id"], name=call["name"], status="error",
+            )
+        if isinstance(result, ToolMessage):
+            return result
+        return ToolMessage(content=str(result), tool_call_id=call["id"], name=call["name"])
+
+    async def collect(
+        self,
+        message: AIMessage,
+        run_rest: Callable[[List[ToolCall]], Awaitable[List[ToolMessage]]],
+    ) -> List[ToolMessage]:
+        """Tool outputs for every call in message, in call order, running calls that were not started early"""
+        early = {c["id"]: self._tasks.pop(c["id"]) for c in message.tool_calls if c.get("id") in self._tasks}
+        rest = [c for c in message.tool_calls if c.get("id") not in early]
+        early_results, rest_results = await asyncio.gather(
+            asyncio.gather(*[self._result(c, early[c["id"]]) for c in message.tool_calls if c.get("id") in early]),
+            run_rest(rest) if rest else asyncio.sleep(0, result=[]),
+        )
+        self.used += len(early)
+        by_id: Dict[Optional[str], ToolMessage] = {m.tool_call_id: m for m in [*early_results, *rest_results]}
+        ordered = [by_id.pop(c.get("id")) for c in message.tool_calls if c.get("id") in by_id]
+        return ordered + list(by_id.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {"started": self.started, "used": self.used, "cancelled": self.cancelled, "pending": len(self._tasks)}
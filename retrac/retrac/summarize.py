@@ -0,0 +1,91 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import logging
+import math
+from typing import Any, List, Sequence
+from .config import VisitSummarizeConfig
+from .lexical import score_chunks, split_chunks
+from .ratelimit import RateLimiter
+from .resilience import retry_call
+from .tracing import record
+
+logger = logging.getLogger(__name__)
+
+CHUNK_EXTRACT_PROMPT = """The following is one excerpt of a longer webpage. Extract every piece of information
+in it that is relevant to the user goal, keeping the original wording, numbers, names and dates.
+If nothing in the excerpt is relevant, answer exactly "NONE".
+## **Webpage Excerpt**
+{chunk}
+## **User Goal**
+{goal}
+"""
+
+
+def estimate_tokens(text: str, chars_per_token: float) -> int:
+    return math.ceil(len(text) / chars_per_token)
+
+
+def select_chunks(pages: Sequence[str], goal: str, cfg: VisitSummarizeConfig) -> List[str]:
+    """Chunk every page and keep the max_chunks most goal-relevant chunks in document order"""
+    max_chars = int(cfg.chunk_tokens * cfg.chars_per_token)
+    chunks = [chunk for page in pages for chunk in split_chunks(page, max_chars)]
+    if len(chunks) <= cfg.max_chunks:
+        return chunks
+    scores = score_chunks(chunks, goal)
+    top = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)[:cfg.max_chunks]
+    return [chunks[i] for i in sorted(top)]
+
+
+async def map_reduce_summarize(
+    client: Any,
+    model: str,
+    pages: Sequence[str],
+    goal: str,
+    reduce_prompt: str,
+    cfg: VisitSummarizeConfig,
+    limiter: RateLimiter | None = None,
+) -> str:
+    """Summarize pages in one request, or extract from top chunks in parallel and merge"""
+
+    async def complete(prompt: str) -> str:
+        estimated = estimate_tokens(prompt, cfg.chars_per_token)
+
+        async def request() -> Any:
+            async with (limiter.limit(estimated) if limiter is not None else contextlib.nullcontext()):
+                return await client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+
+        response = await retry_call(str(client.base_url), request)
+        if response.usage is not None:
+            record("summarize_input_tokens", response.usage.prompt_tokens)
+            record("summarize_output_tokens", response.usage.completion_tokens)
+        if limiter is not None and response.usage is not None:
+            await limiter.settle(estimated, response.usage.total_tokens)
+        return response.choices[0].message.content or ""
+
+    webpage_content = "\n".join(pages)
+    if estimate_tokens(webpage_content, cfg.chars_per_token) <= cfg.single_pass_tokens:
+        return await complete(reduce_prompt.format(webpage_content=webpage_content, goal=goal))
+
+    chunks = select_chunks(pages, goal, cfg)
+    semaphore = asyncio.Semaphore(cfg.max_parallel)
+
+    async def extract(chunk: str) -> str:
+        async with semaphore:
+            return await complete(CHUNK_EXTRACT_PROMPT.format(chunk=chunk, goal=goal))
+
+    results = await asyncio.gather(*[extract(c) for c in chunks], return_exceptions=True)
+    partials = []
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.error("Chunk summarization failed: %s", result)
+        elif result.strip() and result.strip() != "NONE":
+            partials.append(result.strip())
+    if not partials:
+        if all(isinstance(r, BaseException) for r in results):
+            raise results[0]
+        partials = ["No content relevant to the goal was found."]
+    return await complete(reduce_prompt.format(webpage_content="\n\n".join(partials), goal=goal))
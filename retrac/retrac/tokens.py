@@ -0,0 +1,117 @@
+from __future__ import annotations
+import logging
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence, Tuple
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+logger = logging.getLogger(__name__)
+
+# message token counts remembered per counter (least recently used are dropped)
+TOKEN_COUNT_CACHE_SIZE = 16384
+# role and formatting tokens the chat template adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+CALIBRATION_WEIGHT = 0.2
+
+
+def _load_tokenizer(name: str) -> Optional[Callable[[str], int]]:
+    """Return a token counting function for "tiktoken:<encoding>" or a HuggingFace tokenizer name/path"""
+    try:
+        if name.startswith("tiktoken:"):
+            import tiktoken
+            encoding = tiktoken.get_encoding(name[len("tiktoken:"):])
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(name)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception as e:
+        logger.warning("Could not load tokenizer '%s', falling back to the calibrated estimator: %s", name, e)
+        return None
+
+
+class TokenCounter:
+    """Counts message tokens with a local tokenizer, or a chars-per-token estimator calibrated from usage"""
+
+    def __init__(self, tokenizer: str | None = None, chars_per_token: float = 4.0, cache_size: int = TOKEN_COUNT_CACHE_SIZE) -> None:
+        self._encode = _load_tokenizer(tokenizer) if tokenizer else None
+        self.chars_per_token = chars_per_token
+        self.cache_size = cache_size
+        # (message id, type, content length, content hash) -> token count; messages are never modified
+        self._counts: OrderedDict[Tuple[Optional[str], str, int, int], int] = OrderedDict()
+
+    def count_text(self, text: str) -> int:
+        if self._encode is not None:
+            return self._encode(text)
+        return int(len(text) / self.chars_per_token) + 1
+
+    def count(self, msg: BaseMessage) -> int:
+        """Token count of one message, computed once per message id and content"""
+        text = msg.text or ""
+        key = (msg.id, msg.type, len(text), hash(text))
+        cached = self._counts.get(key)
+        if cached is not None:
+            self._counts.move_to_end(key)
+            return cached
+        cached = self.count_text(text) + MESSAGE_OVERHEAD_TOKENS
+        self._counts[key] = cached
+        if len(self._counts) > self.cache_size:
+            self._counts.popitem(last=False)
+        return cached
+
+    def context_tokens(self, messages: Sequence[BaseMessage]) -> int:
+        """Tokens of the next request, anchored on the usage reported for the latest AI message"""
+        tail = 0
+        for msg in reversed(messages):
+            if isinstance(msg, AIMessage) and msg.usage_metadata:
+                return msg.usage_metadata.get("total_tokens", 0) + tail
+            tail += self.count(msg)
+        return tail
+
+    def calibrate(self, messages: Sequence[BaseMessage]) -> None:
+        """Refine chars_per_token from the tokens the server billed for the tool outputs of the last turn"""
+        if self._encode is not None or not messages:
+            return
+        last = messages[-1]
+        if not isinstance(last, AIMessage) or not last.usage_metadata:
+            return
+        chars = 0
+        for msg in reversed(messages[:-1]):
+            if isinstance(msg, ToolMessage):
+                chars += len(msg.text or "")
+                continue
+            if isinstance(msg, AIMessage) and msg.usage_metadata and chars:
+                delta = last.usage_metadata.get("input_tokens", 0) - msg.usage_metadata.get("total_tokens", 0)
+                if delta > 0:
+                    observed = chars / delta
+                    self.chars_per_token += CALIBRATION_WEIGHT * (observed - self.chars_per_token)
+            return
+
+    def truncate(self, msg: BaseMessage, max_tokens: int) -> BaseMessage:
+        """Copy of msg whose content fits max_tokens, keeping the head of the text"""
+        if self.count(msg) <= max_tokens:
+            return msg
+        text = msg.text or ""
+        budget = max(max_tokens - MESSAGE_OVERHEAD_TOKENS, 0)
+        ratio = len(text) / max(self.count_text(text), 1)
+        kept = text[:int(budget * ratio)]
+        content = f"{kept}\n[... truncated {len(text) - len(kept)} characters to fit the context window]"
+        return msg.model_copy(update={"content": content})
+
+    def fit_tool_messages(
+        self,
+        base: Sequence[BaseMessage],
+        new: List[BaseMessage],
+        max_context: int | None,
+        max_message_tokens: int | None,
+    ) -> List[BaseMessage]:
+        """Truncate new tool outputs so base + new stays within max_context"""
+        if max_message_tokens:
+            new = [self.truncate(m, max_message_tokens) for m in new]
+        if max_context is None:
+            return new
+        budget = max_context - self.context_tokens(base)
+        total = sum(self.count(m) for m in new)
+        if total <= budget:
+            return new
+        per_message = max(budget // max(len(new), 1), 64)
+        logger.warning("Tool outputs (%d tokens) exceed the remaining context (%d), truncating", total, budget)
+        return [self.truncate(m, per_message) for m in new]
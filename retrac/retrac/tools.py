@@ -1,32 +1,37 @@
 import json
 import asyncio
+import contextlib
 import aiohttp
 import os
-from typing import Dict
+from typing import Any, Awaitable, Callable, Dict
 from pydantic import BaseModel, Field
 from langchain.tools import tool
-import http.client
-import openai
+from .transport import get_tool_transport, aclose_tool_transport
+from .cache import get_single_flight, get_tool_cache, normalize_query, normalize_url, content_key
+from .config import VisitSummarizeConfig
+from .evidence import get_evidence_index
+from .prefetch import get_page_prefetcher
+from .summarize import map_reduce_summarize
+from .ratelimit import get_rate_limiter
+from .resilience import retry_call
+from .tracing import record, span
 
-import dotenv
-dotenv.load_dotenv()
-
-
-TOOL_SERVER_URL = None # for custom tool server
-SERPER_API_KEY = os.getenv("SERPER_API_KEY")
-JINA_API_KEY = os.getenv("JINA_API_KEY")
-
-MODEL_FOR_VISIT_SUMMARIZE = os.getenv("MODEL_FOR_VISIT_SUMMARIZE")
-BASE_URL_FOR_VISIT_SUMMARIZE = os.getenv("BASE_URL_FOR_VISIT_SUMMARIZE")
-API_KEY_FOR_VISIT_SUMMARIZE = os.getenv("API_KEY_FOR_VISIT_SUMMARIZE")
-
-print("="*100)
-print(f"SERPER_API_KEY: {SERPER_API_KEY}")
-print(f"JINA_API_KEY: {JINA_API_KEY}")
-print(f"MODEL_FOR_VISIT_SUMMARIZE: {MODEL_FOR_VISIT_SUMMARIZE}")
-print(f"BASE_URL_FOR_VISIT_SUMMARIZE: {BASE_URL_FOR_VISIT_SUMMARIZE}")
-print(f"API_KEY_FOR_VISIT_SUMMARIZE: {API_KEY_FOR_VISIT_SUMMARIZE}")
-print("="*100)
+# for custom tool server exposing /search and /visit
+TOOL_SERVER_URL = os.getenv("TOOL_SERVER_URL") or None
+# credentials (SERPER_API_KEY, JINA_API_KEY, *_FOR_VISIT_SUMMARIZE) are read from the environment at call time
+# the summarizer always shares the endpoint budget of BASE_URL_FOR_VISIT_SUMMARIZE with the LLM node;
+# when set (non-zero), these override that endpoint's limits
+SUMMARIZE_QPS_LIMIT = float(os.getenv("SUMMARIZE_QPS_LIMIT", 0))
+SUMMARIZE_TPM_LIMIT = int(os.getenv("SUMMARIZE_TPM_LIMIT", 0))
+SUMMARIZE_MAX_CONCURRENCY = int(os.getenv("SUMMARIZE_MAX_CONCURRENCY", 0))
+# search/browse provider budgets, enforced across processes via RATE_LIMIT_BACKEND
+SEARCH_QPS_LIMIT = float(os.getenv("SEARCH_QPS_LIMIT", 0))
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", 0))
+BROWSE_QPS_LIMIT = float(os.getenv("BROWSE_QPS_LIMIT", 0))
+BROWSE_MAX_CONCURRENCY = int(os.getenv("BROWSE_MAX_CONCURRENCY", 0))
+# passages returned per recall query
+EVIDENCE_TOP_K = int(os.getenv("EVIDENCE_TOP_K", 5))
+VISIT_SUMMARIZE_CONFIG = VisitSummarizeConfig()
 
 SUMMARIZE_PROMPT = """Please process the following webpage content and user goal to extract relevant
 information:
@@ -52,68 +57,134 @@ class VisitInput(BaseModel):
     url: list[str] = Field(description="List of URLs to visit")
     goal: str = Field(description="The goal or question to answer from the URLs")
 
+class RecallInput(BaseModel):
+    query: list[str] = Field(description="The list of keyword queries to look up in the evidence collected so far")
+
+def configure_visit_summarize(cfg: VisitSummarizeConfig) -> None:
+    """Override the chunked summarization limits used by the visit tool"""
+    global VISIT_SUMMARIZE_CONFIG
+    VISIT_SUMMARIZE_CONFIG = cfg
+
+def _index(text: str, url: str | None = None, title: str | None = None, source: str = "page") -> None:
+    """Add tool output to the question's evidence index, when indexing is on"""
+    index = get_evidence_index()
+    if index is not None and text:
+        record("evidence_passages", index.add(text, url, title, source))
+
+def _limit(endpoint: str, qps: float, max_concurrency: int):
+    if not (qps or max_concurrency):
+        return contextlib.nullcontext()
+    return get_rate_limiter(endpoint, qps=qps or None, max_concurrency=max_concurrency or None).limit()
+
+async def _cached(namespace: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Return the cached value, or fetch it once for all concurrent callers with the same key"""
+    cache = get_tool_cache()
+    value = await cache.get(namespace, key)
+    if value is not None:
+        record("tool_cache_hits")
+        return value
+    record("tool_cache_misses")
+
+    async def fetch_and_store() -> Any:
+        value = await fetch()
+        await cache.set(namespace, key, value)
+        return value
+    flight = get_single_flight()
+    if flight.in_flight(namespace, key):
+        record("single_flight_saved")
+    return await flight.do(namespace, key, fetch_and_store)
+
+async def _read_json(response: aiohttp.ClientResponse) -> Any:
+    body = await response.read()
+    record("bytes_fetched", len(body))
+    return json.loads(body)
+
 async def serper_search(query: str) -> Dict:
-    async with aiohttp.ClientSession() as session:
-        response = await session.post(
+    async def fetch() -> Dict:
+        session = get_tool_transport().session
+        async with _limit("https://google.serper.dev", SEARCH_QPS_LIMIT, SEARCH_MAX_CONCURRENCY), session.post(
             "https://google.serper.dev/search",
             json={"q": query},
-            headers={"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"},
-        )
-        response.raise_for_status()
-        result = await response.json()
+            headers={"X-API-KEY": os.getenv("SERPER_API_KEY"), "Content-Type": "application/json"},
+        ) as response:
+            response.raise_for_status()
+            return await _read_json(response)
+    result = await retry_call("https://google.serper.dev", fetch)
     return {"items": result["organic"]}  
 
 async def jina_browse(url: str) -> Dict:
     url = f"https://r.jina.ai/{url}"
     headers = {
-        "Authorization": f"Bearer {JINA_API_KEY}"
+        "Authorization": f"Bearer {os.getenv('JINA_API_KEY')}"
     }
-    async with aiohttp.ClientSession() as session:
-        response = await session.get(url, headers=headers)
-        response.raise_for_status()
-        result = await response.text()
-    return result
+
+    async def fetch() -> str:
+        session = get_tool_transport().session
+        async with _limit("https://r.jina.ai", BROWSE_QPS_LIMIT, BROWSE_MAX_CONCURRENCY), session.get(url, headers=headers) as response:
+            response.raise_for_status()
+            body = await response.read()
+            record("bytes_fetched", len(body))
+            return body.decode(response.get_encoding(), errors="replace")
+    return await retry_call("https://r.jina.ai", fetch)
+
+async def _browse(url: str) -> str:
+    return await _cached("page", content_key(normalize_url(url)), lambda: jina_browse(url))
+
+async def _page(url: str) -> str:
+    """A page prefetched after search when there is one, else fetched now"""
+    prefetcher = get_page_prefetcher()
+    if prefetcher is not None:
+        page = await prefetcher.take(url)
+        if page is not None:
+            return page
+    return await _browse(url)
 
 async def jina_visit(urls: list[str], goal: str) -> Dict:
-    webpage_content = "\n".join(await asyncio.gather(*[jina_browse(url) for url in urls]))
-    prompt = SUMMARIZE_PROMPT.format(webpage_content=webpage_content, goal=goal)
-    client = openai.AsyncOpenAI(
-        base_url=BASE_URL_FOR_VISIT_SUMMARIZE,
-        api_key=API_KEY_FOR_VISIT_SUMMARIZE,
+    pages = await asyncio.gather(*[_page(url) for url in urls])
+    for url, page in zip(urls, pages):
+        _index(page, url, source="page")
+    base_url = os.getenv("BASE_URL_FOR_VISIT_SUMMARIZE")
+    client = get_tool_transport().summarizer(base_url, os.getenv("API_KEY_FOR_VISIT_SUMMARIZE"))
+    limiter = get_rate_limiter(base_url)
+    limiter.override(
+        qps=SUMMARIZE_QPS_LIMIT or None,
+        tpm=SUMMARIZE_TPM_LIMIT or None,
+        max_concurrency=SUMMARIZE_MAX_CONCURRENCY or None,
     )
-    response = await client.chat.completions.create(
-        model=MODEL_FOR_VISIT_SUMMARIZE,
-        messages=[{"role": "user", "content": prompt}],
+    summary = await map_reduce_summarize(
+        client, os.getenv("MODEL_FOR_VISIT_SUMMARIZE"), pages, goal, SUMMARIZE_PROMPT, VISIT_SUMMARIZE_CONFIG, limiter,
     )
-    return {"semanticDocument": f"The useful information in {urls} for user goal {goal} as follows: {response.choices[0].message.content}"}
+    return {"semanticDocument": f"The useful information in {urls} for user goal {goal} as follows: {summary}"}
 
 async def _search(query: str) -> Dict:
     payload = {
         "query": query,
         "provider": 'google',
     }
-    async with aiohttp.ClientSession() as session:
-        response = await session.post(
+
+    async def fetch() -> Dict:
+        session = get_tool_transport().session
+        async with _limit(f"{TOOL_SERVER_URL}/search", SEARCH_QPS_LIMIT, SEARCH_MAX_CONCURRENCY), session.post(
             f"{TOOL_SERVER_URL}/search",
             json=payload,
-        )
-        if response.status == 429:
-            print(f"[429] query={query}")
-        response.raise_for_status()
-        result = await response.json()
-    return result
+        ) as response:
+            response.raise_for_status()
+            return await _read_json(response)
+    return await retry_call(f"{TOOL_SERVER_URL}/search", fetch)
 
 
 async def _visit(urls: list[str], goal: str) -> Dict:
     payload = {"urls": urls, "goal": goal, "style": 'tongyi'}
-    async with aiohttp.ClientSession() as session:
-        response = await session.post(
+
+    async def fetch() -> Dict:
+        session = get_tool_transport().session
+        async with _limit(f"{TOOL_SERVER_URL}/visit", BROWSE_QPS_LIMIT, BROWSE_MAX_CONCURRENCY), session.post(
             f"{TOOL_SERVER_URL}/visit",
             json=payload,
-        )
-        response.raise_for_status()
-        result = await response.json()
-    return result
+        ) as response:
+            response.raise_for_status()
+            return await _read_json(response)
+    return await retry_call(f"{TOOL_SERVER_URL}/visit", fetch)
 
 
 @tool("search", args_schema=SearchInput, description="Search the web for information about a query using google search.")
@@ -121,21 +192,37 @@ async def search(query: list[str]) -> str:
     """Search the web for information about a query using google search."""
 
     search_func = _search if TOOL_SERVER_URL else serper_search
-    batch_results = await asyncio.gather(*[search_func(q) for q in query], return_exceptions=True)
+    provider = TOOL_SERVER_URL or "serper"
+    with span("tool.search", kind="tool", queries=len(query)):
+        batch_results = await asyncio.gather(
+            *[_cached("search", content_key(provider, normalize_query(q)), lambda q=q: search_func(q)) for q in query],
+            return_exceptions=True,
+        )
 
-    success_results = [result for result in batch_results if not isinstance(result, BaseException)]
-    if len(success_results) == 0:
+    if all(isinstance(result, BaseException) for result in batch_results):
         return f"Failed to get items for queries {query}. All queries failed."
 
     outputs = []
+    # visit fetches pages itself only without a tool server, so only then can they be fetched ahead
+    prefetcher = get_page_prefetcher() if not TOOL_SERVER_URL else None
 
-    for batch_result in success_results:
+    for q, batch_result in zip(query, batch_results):
+        if isinstance(batch_result, BaseException):
+            # tell the model which query failed instead of silently dropping it
+            outputs.append(f"Failed to get items for query {q}: {type(batch_result).__name__}: {batch_result}")
+            continue
         search_results = []
         if 'items' not in batch_result:
-            search_results.append(f"Failed to get items for query {query}. Returned result: {batch_result}")
+            outputs.append(f"Failed to get items for query {q}. Returned result: {batch_result}")
+            continue
         for item in batch_result['items']:
             item.pop("error_message", None)
             search_results.append(item)
+            if isinstance(item, dict):
+                _index(item.get("snippet") or "", item.get("link"), item.get("title"), source="search")
+        if prefetcher is not None:
+            links = [item.get("link") for item in search_results[:prefetcher.top_k] if isinstance(item, dict)]
+            prefetcher.schedule([link for link in links if isinstance(link, str) and link.startswith("http")], _browse)
         outputs.append(json.dumps(search_results, ensure_ascii=False))
     
     return '\n'.join(outputs)
@@ -145,20 +232,61 @@ async def search(query: list[str]) -> str:
 async def visit(url: list[str], goal: str) -> str:
     """Visit multiple URLs and extract information based on a goal."""
     visit_func = _visit if TOOL_SERVER_URL else jina_visit
-    result = await visit_func(url, goal)
-    return result['semanticDocument']
+    provider = TOOL_SERVER_URL or "jina"
+    normalized = [normalize_url(u) for u in url]
+    index = get_evidence_index()
+    seen = [(u, list(index.visited[n])) for u, n in zip(url, normalized) if n in index.visited] if index is not None else []
+    with span("tool.visit", kind="tool", urls=len(url)):
+        result = await _cached("summary", content_key(provider, normalized, goal), lambda: visit_func(url, goal))
+    document = result['semanticDocument']
+    if index is not None:
+        _index(document, " ".join(url), source="visit")
+        for n in normalized:
+            index.mark_visited(n, goal)
+    if seen:
+        record("revisits", len(seen))
+        notes = "\n".join(f"- {u} (visited before for: {'; '.join(goals)})" for u, goals in seen)
+        document = f"Note: already visited in this question; use the recall tool to look up what was found instead of visiting again:\n{notes}\n\n{document}"
+    return document
+
+
+@tool("recall", args_schema=RecallInput, description="Look up evidence already collected for this question (search results and visited pages, including from previous attempts) without any web request.")
+async def recall(query: list[str]) -> str:
+    """Look up evidence already collected for this question without any web request."""
+    index = get_evidence_index()
+    if index is None:
+        return "Recall is not available: no evidence index for this question."
+    outputs = []
+    with span("tool.recall", kind="tool", queries=len(query), passages=len(index)):
+        for q in query:
+            record("recall_lookups")
+            hits = index.search(q, EVIDENCE_TOP_K)
+            if not hits:
+                outputs.append(f"No collected evidence matches '{q}'. Use search or visit to find it.")
+                continue
+            lines = [f"Collected evidence for '{q}':"]
+            for score, passage in hits:
+                title = f"{passage.title} " if passage.title else ""
+                lines.append(f"[{passage.source}] {title}({passage.url}) score={score:.2f}\n{passage.text}")
+            outputs.append("\n\n".join(lines))
+    return "\n\n".join(outputs)
 
 
 if __name__ == "__main__":
+    from .config import load_env
+    load_env()
+
     async def test_search_tools(query: list[str]) -> str:
         result = await search.ainvoke({"query": query})
         print(result)
+        await aclose_tool_transport()
 
     asyncio.run(test_search_tools(["Elden Ring","Golden Tree"]))
 
     async def test_visit_tools(urls: list[str], goal: str) -> str:
         result = await visit.ainvoke({"url": urls, "goal": goal})
         print(result)
+        await aclose_tool_transport()
 
     asyncio.run(test_visit_tools(["https://en.wikipedia.org/wiki/Elden_Ring"], "Who is the main character of Elden Ring?"))
 
@@ -0,0 +1,269 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# JSONL file every finished span is appended to; empty disables the local exporter
+TRACE_JSON_PATH = os.getenv("TRACE_JSON_PATH", "")
+# export spans through the OpenTelemetry API (an OTLP exporter is set up when OTEL_EXPORTER_OTLP_ENDPOINT is set)
+TRACE_OTEL = os.getenv("TRACE_OTEL", "0").lower() in ("1", "true", "yes")
+
+
+class Span:
+    """One timed operation: a graph node, an LLM attempt, a tool HTTP request, ..."""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent", "start", "end", "start_ns", "attributes", "error", "handles")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent: Span | None, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.start = time.monotonic()
+        self.start_ns = time.time_ns()
+        self.end: float | None = None
+        self.attributes = attributes
+        self.error: str | None = None
+        # per-exporter objects, e.g. the live OpenTelemetry span
+        self.handles: Dict[str, Any] = {}
+
+    @property
+    def duration_s(self) -> float:
+        return (self.end if self.end is not None else time.monotonic()) - self.start
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "start_unix_ns": self.start_ns,
+            "duration_s": round(self.duration_s, 6),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """Spans and counters of one question, rolled up into process_details at the end"""
+
+    def __init__(self, trace_id: str | None = None) -> None:
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.start = time.monotonic()
+        self.counters: Dict[str, float] = defaultdict(float)
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: float) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def finish(self, span: Span) -> None:
+        duration = span.duration_s
+        with self._lock:
+            agg = self._by_name.setdefault(span.name, {"kind": span.kind, "count": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0})
+            agg["count"] += 1
+            agg["errors"] += span.error is not None
+            agg["total_s"] += duration
+            agg["max_s"] = max(agg["max_s"], duration)
+
+    def rollup(self) -> Dict[str, Any]:
+        """Wall time, per-span-name timings and counters (tokens, bytes, waits, retries)"""
+        with self._lock:
+            spans = {
+                name: {**agg, "total_s": round(agg["total_s"], 3), "max_s": round(agg["max_s"], 3)}
+                for name, agg in sorted(self._by_name.items(), key=lambda kv: -kv[1]["total_s"])
+            }
+            counters = {k: round(v, 3) for k, v in self.counters.items()}
+        return {"trace_id": self.trace_id, "wall_s": round(time.monotonic() - self.start, 3), "spans": spans, "counters": counters}
+
+
+class SpanExporter:
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        pass
+
+
+class JsonSpanExporter(SpanExporter):
+    """Appends every finished span as one JSON line"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def on_end(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+
+class OTelSpanExporter(SpanExporter):
+    """Mirrors spans onto OpenTelemetry spans (requires opentelemetry-api)"""
+
+    def __init__(self, tracer: Any = None) -> None:
+        from opentelemetry import trace as otel_trace
+        self._otel = otel_trace
+        self.tracer = tracer or otel_trace.get_tracer("retrac")
+
+    def on_start(self, span: Span) -> None:
+        parent = span.parent.handles.get("otel") if span.parent is not None else None
+        context = self._otel.set_span_in_context(parent) if parent is not None else None
+        span.handles["otel"] = self.tracer.start_span(span.name, context=context, start_time=span.start_ns)
+
+    def on_end(self, span: Span) -> None:
+        otel_span = span.handles.pop("otel", None)
+        if otel_span is None:
+            return
+        otel_span.set_attribute("retrac.kind", span.kind)
+        otel_span.set_attribute("retrac.trace_id", span.trace_id)
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(key, value)
+        if span.error is not None:
+            otel_span.set_status(self._otel.Status(self._otel.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=span.start_ns + int(span.duration_s * 1e9))
+
+
+def _configure_otel() -> OTelSpanExporter | None:
+    try:
+        exporter = OTelSpanExporter()
+    except ImportError:
+        logger.warning("TRACE_OTEL is set but opentelemetry-api is not installed")
+        return None
+    if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        try:
+            from opentelemetry import trace as otel_trace
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "retrac")}))
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            otel_trace.set_tracer_provider(provider)
+            exporter = OTelSpanExporter(provider.get_tracer("retrac"))
+        except ImportError:
+            logger.warning("OTLP export needs opentelemetry-sdk and opentelemetry-exporter-otlp-proto-http; using the global tracer provider")
+    return exporter
+
+
+_exporters: List[SpanExporter] = []
+if TRACE_JSON_PATH:
+    _exporters.append(JsonSpanExporter(TRACE_JSON_PATH))
+if TRACE_OTEL:
+    _otel_exporter = _configure_otel()
+    if _otel_exporter is not None:
+        _exporters.append(_otel_exporter)
+
+
+def add_span_exporter(exporter: SpanExporter) -> None:
+    _exporters.append(exporter)
+
+
+_current_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("retrac_trace", default=None)
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("retrac_span", default=None)
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def question_trace(trace_id: str | None = None) -> Iterator[Trace]:
+    """Collect spans and counters of everything run in this context into one Trace"""
+    trace = Trace(trace_id)
+    token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(token)
+
+
+@contextlib.contextmanager
+def span(name: str, kind: str = "internal", **attributes: Any) -> Iterator[Span | None]:
+    """Time a block as a child of the current span; a no-op outside a trace when no exporter is set"""
+    trace = _current_trace.get()
+    if trace is None and not _exporters:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(name, kind, trace.trace_id if trace is not None else "", parent, attributes)
+    for exporter in _exporters:
+        exporter.on_start(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end = time.monotonic()
+        if trace is not None:
+            trace.finish(current)
+        for exporter in _exporters:
+            try:
+                exporter.on_end(current)
+            except Exception as e:
+                logger.warning("Span exporter %s failed: %s", type(exporter).__name__, e)
+
+
+def record(name: str, value: float = 1, **span_attributes: Any) -> None:
+    """Add to a per-question counter, and annotate the current span"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, value)
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[name] = current.attributes.get(name, 0) + value
+        current.attributes.update(span_attributes)
+
+
+def record_usage(usage: Dict[str, Any] | None) -> None:
+    """Token counters from a response's usage_metadata"""
+    if not usage:
+        return
+    record("llm_input_tokens", usage.get("input_tokens", 0))
+    record("llm_output_tokens", usage.get("output_tokens", 0))
+    cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+    if cached:
+        record("llm_cached_tokens", cached)
+    reasoning = (usage.get("output_token_details") or {}).get("reasoning") or 0
+    if reasoning:
+        record("llm_reasoning_tokens", reasoning)
+
+
+def traced_node(name: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a graph node so each run is a span; keeps the signature LangGraph inspects"""
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name, kind="node"):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with span(name, kind="node"):
+            return fn(*args, **kwargs)
+    return wrapper
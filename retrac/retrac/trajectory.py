@@ -0,0 +1,261 @@
+from __future__ import annotations
+import atexit
+import glob
+import gzip
+import io
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from langchain_core.messages import BaseMessage, convert_to_openai_messages, message_to_dict, messages_from_dict
+
+logger = logging.getLogger(__name__)
+
+# directory trajectory logs are written to (one file per process); empty keeps rollouts in process_details
+TRAJECTORY_DIR = os.getenv("TRAJECTORY_DIR", "")
+# gzip, or zstd (requires the zstandard package)
+TRAJECTORY_COMPRESSION = os.getenv("TRAJECTORY_COMPRESSION", "gzip").lower()
+# seconds between flushes of the compressed stream, so readers see recent rollouts
+TRAJECTORY_FLUSH_S = float(os.getenv("TRAJECTORY_FLUSH_S", 5))
+
+_SUFFIXES = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+def _open_writer(path: str, compression: str) -> IO[bytes]:
+    if compression == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, "ab"), closefd=True)
+    return gzip.open(path, "ab", compresslevel=6)
+
+
+def _open_reader(path: str) -> IO[str]:
+    if path.endswith(".zst"):
+        import zstandard
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+
+class TrajectoryRecorder:
+    """Writes rollouts of this process to one append-only compressed JSONL file.
+
+    Records are serialized by the caller and compressed and written by a background
+    thread, so the event loop never waits on the disk. Each line is one of
+    {"type": "begin", "rollout", "question", "thread_id", "cycle", "index", "ts"},
+    {"type": "message", "rollout", "message"} or
+    {"type": "end", "rollout", "messages", "summary_messages", "ts"}.
+    """
+
+    def __init__(self, directory: str, compression: str = TRAJECTORY_COMPRESSION, flush_s: float = TRAJECTORY_FLUSH_S) -> None:
+        if compression not in _SUFFIXES:
+            raise ValueError(f"unknown trajectory compression {compression!r}, expected one of {sorted(_SUFFIXES)}")
+        os.makedirs(directory, exist_ok=True)
+        name = f"trajectories-{socket.gethostname()}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}{_SUFFIXES[compression]}"
+        self.path = os.path.join(directory, name)
+        self._file = _open_writer(self.path, compression)
+        self._flush_s = flush_s
+        self._counts: Dict[str, int] = {}
+        self._queue: queue.SimpleQueue[bytes | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trajectory-writer", daemon=True)
+        self._thread.start()
+        self._closed = False
+        self.stats = {"rollouts": 0, "messages": 0, "bytes": 0}
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            try:
+                line = self._queue.get(timeout=self._flush_s)
+            except queue.Empty:
+                line = b""
+            if line is None:
+                break
+            if line:
+                self._file.write(line)
+            if time.monotonic() - last_flush >= self._flush_s:
+                self._flush()
+                last_flush = time.monotonic()
+        self._flush()
+        self._file.close()
+
+    def _flush(self) -> None:
+        try:
+            self._file.flush()
+        except Exception as e:
+            logger.warning("Flushing %s failed: %s", self.path, e)
+
+    def _put(self, record: Dict[str, Any]) -> None:
+        line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        self.stats["bytes"] += len(line)
+        self._queue.put(line)
+
+    def begin(self, messages: Sequence[BaseMessage], question: str | None = None, thread_id: str | None = None,
+              cycle: int | None = None, index: int | None = None) -> Dict[str, Any]:
+        """Start a rollout from its initial messages; the returned reference goes into graph state"""
+        rollout = uuid.uuid4().hex
+        self._counts[rollout] = 0
+        self.stats["rollouts"] += 1
+        self._put({"type": "begin", "rollout": rollout, "question": question, "thread_id": thread_id,
+                   "cycle": cycle, "index": index, "ts": time.time()})
+        ref = {"path": self.path, "rollout": rollout}
+        self.append(ref, messages)
+        return ref
+
+    def append(self, ref: Dict[str, Any], messages: Iterable[BaseMessage]) -> None:
+        rollout = ref["rollout"]
+        if rollout not in self._counts:
+            # begun by another process, e.g. a thread resumed from a checkpoint: continue it in this file
+            self._counts[rollout] = 0
+            self._put({"type": "begin", "rollout": rollout, "resumed_from": ref.get("path"), "ts": time.time()})
+        for m in messages:
+            self._put({"type": "message", "rollout": rollout, "message": message_to_dict(m)})
+            self._counts[rollout] = self._counts.get(rollout, 0) + 1
+            self.stats["messages"] += 1
+
+    def end(self, ref: Dict[str, Any], summary_messages: int = 0) -> Dict[str, Any]:
+        """Close a rollout whose last summary_messages messages are its summary exchange.
+
+        Returns the reference with the message count, for process_details.
+        """
+        self.append(ref, [])
+        count = self._counts.pop(ref["rollout"])
+        self._put({"type": "end", "rollout": ref["rollout"], "messages": count, "summary_messages": summary_messages, "ts": time.time()})
+        return {"path": self.path, "rollout": ref["rollout"], "messages": count}
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+
+_recorder: TrajectoryRecorder | None = None
+
+
+def get_trajectory_recorder() -> TrajectoryRecorder | None:
+    """Return the process-wide recorder, or None when TRAJECTORY_DIR is not set"""
+    global _recorder
+    if _recorder is None and TRAJECTORY_DIR:
+        _recorder = TrajectoryRecorder(TRAJECTORY_DIR)
+        atexit.register(_recorder.close)
+    return _recorder
+
+
+@dataclass
+class Rollout:
+    rollout: str
+    path: str
+    question: str | None = None
+    thread_id: str | None = None
+    cycle: int | None = None
+    index: int | None = None
+    messages: List[BaseMessage] = field(default_factory=list)
+    # trailing summary prompt and summary, when the rollout was summarized
+    summary_messages: int = 0
+    complete: bool = False
+
+    def to_openai(self) -> List[Dict[str, Any]]:
+        return convert_to_openai_messages(self.messages)
+
+
+class TrajectoryReader:
+    """Lazily reads trajectory logs: a file, a directory of them, or a glob pattern"""
+
+    def __init__(self, paths: str | Iterable[str]) -> None:
+        if isinstance(paths, str):
+            if os.path.isdir(paths):
+                paths = sorted(glob.glob(os.path.join(paths, "trajectories-*.jsonl.*")))
+            else:
+                paths = sorted(glob.glob(paths)) or [paths]
+        self.paths = list(paths)
+
+    def records(self, path: str | None = None) -> Iterator[Dict[str, Any]]:
+        for p in [path] if path else self.paths:
+            with _open_reader(p) as f:
+                try:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except json.JSONDecodeError:
+                            continue  # partially written line
+                except EOFError:
+                    # the writer is still running or was killed: everything flushed so far is readable
+                    pass
+
+    def rollouts(self, complete_only: bool = False) -> Iterator[Rollout]:
+        """Yield rollouts as they finish in the logs; memory is bounded by the rollouts open at once"""
+        for path in self.paths:
+            open_rollouts: Dict[str, Rollout] = {}
+            pending: Dict[str, List[Dict[str, Any]]] = {}
+            for record in self.records(path):
+                rid = record.get("rollout")
+                kind = record.get("type")
+                if kind == "begin":
+                    open_rollouts[rid] = Rollout(rid, path, record.get("question"), record.get("thread_id"), record.get("cycle"), record.get("index"))
+                    pending[rid] = []
+                elif kind == "message" and rid in pending:
+                    pending[rid].append(record["message"])
+                elif kind == "end" and rid in open_rollouts:
+                    rollout = open_rollouts.pop(rid)
+                    rollout.messages = messages_from_dict(pending.pop(rid))
+                    rollout.summary_messages = record.get("summary_messages", 0)
+                    rollout.complete = True
+                    yield rollout
+            if not complete_only:
+                for rid, rollout in open_rollouts.items():
+                    rollout.messages = messages_from_dict(pending[rid])
+                    yield rollout
+
+    def load(self, ref: Dict[str, Any]) -> Optional[Rollout]:
+        """The rollout a process_details['rollouts'] entry refers to"""
+        reader = TrajectoryReader([ref["path"]])
+        return next((r for r in reader.rollouts() if r.rollout == ref["rollout"]), None)
+
+
+def export_sft(reader: TrajectoryReader, output_path: str, include_summaries: bool = True) -> int:
+    """Write one {"messages": [...openai format...], ...} line per complete rollout; returns the count"""
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as out:
+        for rollout in reader.rollouts(complete_only=True):
+            record = {
+                "id": f"{rollout.thread_id}:{rollout.cycle}:{rollout.index}" if rollout.thread_id else rollout.rollout,
+                "question": rollout.question,
+                "cycle": rollout.cycle,
+                "messages": rollout.to_openai(),
+            }
+            if not include_summaries and rollout.summary_messages:
+                record["messages"] = record["messages"][:-rollout.summary_messages]
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Read trajectory logs written with TRAJECTORY_DIR.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="export complete rollouts as SFT JSONL (OpenAI message format)")
+    export.add_argument("logs", help="log file, directory or glob")
+    export.add_argument("output")
+    export.add_argument("--no-summaries", action="store_true", help="drop each rollout's summary prompt and summary")
+    stats = sub.add_parser("stats", help="count rollouts and messages")
+    stats.add_argument("logs")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        n = export_sft(TrajectoryReader(args.logs), args.output, include_summaries=not args.no_summaries)
+        print(f"exported {n} rollouts to {args.output}")
+    else:
+        rollouts = messages = incomplete = 0
+        for r in TrajectoryReader(args.logs).rollouts():
+            rollouts += 1
+            messages += len(r.messages)
+            incomplete += not r.complete
+        print(json.dumps({"rollouts": rollouts, "messages": messages, "incomplete": incomplete}))
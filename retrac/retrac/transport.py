@@ -0,0 +1,105 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import weakref
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Tuple
+
+if TYPE_CHECKING:
+    import aiohttp
+    import openai
+
+logger = logging.getLogger(__name__)
+
+TOOL_HTTP_MAX_CONNECTIONS = int(os.getenv("TOOL_HTTP_MAX_CONNECTIONS", 200))
+TOOL_HTTP_MAX_PER_HOST = int(os.getenv("TOOL_HTTP_MAX_PER_HOST", 32))
+TOOL_HTTP_KEEPALIVE_S = float(os.getenv("TOOL_HTTP_KEEPALIVE_S", 30))
+TOOL_HTTP_TIMEOUT_S = float(os.getenv("TOOL_HTTP_TIMEOUT_S", 120))
+TOOL_HTTP_CONNECT_TIMEOUT_S = float(os.getenv("TOOL_HTTP_CONNECT_TIMEOUT_S", 15))
+
+
+@dataclass
+class _LoopClients:
+    session: aiohttp.ClientSession | None = None
+    summarizers: Dict[Tuple[str | None, str | None], openai.AsyncOpenAI] = field(default_factory=dict)
+
+
+class ToolTransport:
+    """Pooled aiohttp session and reusable summarizer clients shared by the tools"""
+
+    def __init__(
+        self,
+        max_connections: int = TOOL_HTTP_MAX_CONNECTIONS,
+        max_per_host: int = TOOL_HTTP_MAX_PER_HOST,
+        keepalive_s: float = TOOL_HTTP_KEEPALIVE_S,
+        timeout_s: float = TOOL_HTTP_TIMEOUT_S,
+        connect_timeout_s: float = TOOL_HTTP_CONNECT_TIMEOUT_S,
+    ) -> None:
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.keepalive_s = keepalive_s
+        self.timeout_s = timeout_s
+        self.connect_timeout_s = connect_timeout_s
+        self._clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClients] = weakref.WeakKeyDictionary()
+
+    def _loop_clients(self) -> _LoopClients:
+        # aiohttp sessions cannot be shared across event loops, so each loop gets its own clients
+        loop = asyncio.get_running_loop()
+        clients = self._clients.get(loop)
+        if clients is None:
+            clients = self._clients[loop] = _LoopClients()
+        return clients
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared keep-alive session, opened on first use"""
+        clients = self._loop_clients()
+        if clients.session is None or clients.session.closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_per_host,
+                keepalive_timeout=self.keepalive_s,
+                ttl_dns_cache=300,
+            )
+            timeout = aiohttp.ClientTimeout(total=self.timeout_s, connect=self.connect_timeout_s)
+            clients.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return clients.session
+
+    def summarizer(self, base_url: str | None, api_key: str | None) -> openai.AsyncOpenAI:
+        """Return a reusable AsyncOpenAI client for the visit summarizer"""
+        summarizers = self._loop_clients().summarizers
+        key = (base_url, api_key)
+        client = summarizers.get(key)
+        if client is None:
+            import openai
+            # retries are handled by resilience.retry_call, not the SDK
+            client = openai.AsyncOpenAI(base_url=base_url, api_key=api_key, timeout=self.timeout_s, max_retries=0)
+            summarizers[key] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close the session and summarizer clients opened on the running loop"""
+        clients = self._clients.pop(asyncio.get_running_loop(), None)
+        if clients is None:
+            return
+        if clients.session is not None and not clients.session.closed:
+            await clients.session.close()
+        for client in clients.summarizers.values():
+            await client.close()
+
+
+_tool_transport = ToolTransport()
+
+
+def get_tool_transport() -> ToolTransport:
+    """Return the process-wide tool transport"""
+    return _tool_transport
+
+
+async def aclose_tool_transport() -> None:
+    """Close the process-wide tool transport, after stopping the page prefetches that use it"""
+    from .prefetch import aclose_page_prefetcher
+    await aclose_page_prefetcher()
+    await _tool_transport.aclose()
@@ -2,53 +2,86 @@ from email import message
 import os
 from typing import Any, Dict, Tuple
 import asyncio
-import yaml
+import uuid
+from retrac.config import load_config, load_env
+
+# before importing modules that read their settings from the environment
+load_env()
+
 from retrac.graph import build_graph
+from retrac.components import aclose_llm_clients
+from retrac.transport import aclose_tool_transport
+from retrac.batch import read_questions, run_batch
+from retrac.shard import run_sharded
+from retrac.checkpoint import ThreadNotFound, invoke_with_resume, open_checkpointer
+from retrac.events import stream_question
 from typing import AsyncIterator
 import argparse
-from langchain_core.messages import BaseMessage,convert_to_openai_messages
-
-def load_config(config_path: str) -> dict:
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    return config
-
-async def graph_execution(config_path: str, question: str, **kwargs: Any) -> Dict[str, Any]:
-    recursion_limit = int(os.getenv("RECURSION_LIMIT", "10000"))
-    run_config = {"recursion_limit": recursion_limit}
-    cfg = load_config(config_path)
-    graph = build_graph(cfg)
-    initial_state = {"question": question}
-    app = graph.compile()
-    state = await app.ainvoke(initial_state, config=run_config, **kwargs)
-    return state
 
-async def stream_graph_execution(
-    graph,
-    initial_state: Dict[str, Any],
-    **kwargs: Any,
-) -> AsyncIterator[Dict[str, Any]]:
-    compiled_graph = graph.compile()
+async def aclose_clients() -> None:
+    await aclose_llm_clients()
+    await aclose_tool_transport()
 
-    recursion_limit = int(os.getenv("RECURSION_LIMIT", "10000"))
-    run_config = {"recursion_limit": recursion_limit}
+def make_run_config(question_timeout_s: float | None = None) -> Dict[str, Any]:
+    run_config: Dict[str, Any] = {"recursion_limit": int(os.getenv("RECURSION_LIMIT", "10000"))}
+    question_timeout_s = question_timeout_s or float(os.getenv("QUESTION_TIMEOUT_S", 0)) or None
+    if question_timeout_s:
+        run_config["configurable"] = {"question_timeout_s": question_timeout_s}
+    return run_config
 
-    state = initial_state.copy()
+_compiled_graphs: Dict[str, Any] = {}
 
-    async for event in compiled_graph.astream(state, config=run_config, **kwargs):
-        yield event
-        # same as your code: merge node outputs into state
-        for node_name, node_output in event.items():
-            if node_output is not None:
-                state.update(node_output)
+def get_compiled_graph(config_path: str, checkpointer: Any = None) -> Any:
+    """Load, build and compile the graph for a config once per process"""
+    key = f"{os.path.abspath(config_path)}:{id(checkpointer)}"
+    if key not in _compiled_graphs:
+        _compiled_graphs[key] = build_graph(load_config(config_path)).compile(checkpointer=checkpointer)
+    return _compiled_graphs[key]
 
+async def graph_execution(
+    config_path: str,
+    question: str,
+    checkpoint_db: str | None = None,
+    thread_id: str | None = None,
+    checkpoint_every_tool_step: bool = False,
+    question_timeout_s: float | None = None,
+    resume_only: bool = False,
+) -> Dict[str, Any]:
+    run_config = make_run_config(question_timeout_s)
+    try:
+        async with open_checkpointer(checkpoint_db, checkpoint_every_tool_step) as checkpointer:
+            app = get_compiled_graph(config_path, checkpointer)
+            state = await invoke_with_resume(app, question, run_config, thread_id, resume_only)
+    finally:
+        await aclose_clients()
+    return state
 
 async def run_streaming(config_path: str, question: str) -> AsyncIterator[Dict[str, Any]]:
-    cfg = load_config(config_path)
-    graph = build_graph(cfg)
-    initial_state = {"question": question}
-    async for event in stream_graph_execution(graph, initial_state):
-        yield event
+    """Stream a question's events (new messages as they are appended, then the final result)"""
+    app = get_compiled_graph(config_path)
+    try:
+        async for event in stream_question(app, question, make_run_config(), tokens=False):
+            yield event
+    finally:
+        await aclose_clients()
+
+
+async def batch_execution(
+    config_path: str,
+    input_file: str,
+    output_file: str,
+    concurrency: int,
+    checkpoint_db: str | None = None,
+    checkpoint_every_tool_step: bool = False,
+    question_timeout_s: float | None = None,
+) -> Dict[str, int]:
+    run_config = make_run_config(question_timeout_s)
+    try:
+        async with open_checkpointer(checkpoint_db, checkpoint_every_tool_step) as checkpointer:
+            app = get_compiled_graph(config_path, checkpointer)
+            return await run_batch(app, read_questions(input_file), output_file, concurrency, run_config)
+    finally:
+        await aclose_clients()
 
 
 async def main() -> None:
@@ -70,25 +103,130 @@ async def main() -> None:
         action="store_true",
         help="Enable non-streaming output.",
     )
+    parser.add_argument(
+        "--input-file",
+        type=str,
+        default=None,
+        help="JSONL file of questions ({\"question\": ..., \"id\": ...}) to run in batch mode.",
+    )
+    parser.add_argument(
+        "--output-file",
+        type=str,
+        default="results.jsonl",
+        help="JSONL file batch results are appended to; completed questions are skipped on rerun.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Number of questions run concurrently in batch mode (per worker when --workers > 1).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes for batch mode; each runs its own event loop.",
+    )
+    parser.add_argument(
+        "--checkpoint-db",
+        type=str,
+        default=None,
+        help="SQLite file for durable checkpoints at cycle boundaries (non-streaming and batch modes).",
+    )
+    parser.add_argument(
+        "--checkpoint-every-tool-step",
+        action="store_true",
+        help="Also checkpoint after every tool step, not only at the end of each cycle.",
+    )
+    parser.add_argument(
+        "--thread-id",
+        type=str,
+        default=None,
+        help="Thread id for checkpointing a single question; a new one is generated if omitted.",
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        default=None,
+        metavar="THREAD_ID",
+        help="Resume an interrupted run from its last checkpoint (requires --checkpoint-db).",
+    )
+    parser.add_argument(
+        "--question-timeout",
+        type=float,
+        default=None,
+        help="Seconds budgeted per question; LLM/tool requests and retries stop once it is spent (default: QUESTION_TIMEOUT_S).",
+    )
+
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as an HTTP server (SSE and websocket streaming) instead of answering one question.",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Server bind address.")
+    parser.add_argument("--port", type=int, default=8000, help="Server port.")
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=32,
+        help="Questions the server runs concurrently; more are queued.",
+    )
+    parser.add_argument(
+        "--max-queued",
+        type=int,
+        default=128,
+        help="Questions the server queues before rejecting new ones with 503.",
+    )
 
     args = parser.parse_args()
+    if args.resume and not args.checkpoint_db:
+        parser.error("--resume requires --checkpoint-db")
 
-    if not args.non_streaming:
-        message_ids = set()
-        merged_state = {}
+    if args.serve:
+        # imported here: the server is the only mode that needs aiohttp's web framework
+        from retrac.server import AgentServer, serve
+        server = AgentServer(
+            {"default": args.config}, args.max_sessions, args.max_queued, make_run_config(args.question_timeout),
+            args.checkpoint_db, args.checkpoint_every_tool_step,
+        )
+        print(f"Serving {args.config} on http://{args.host}:{args.port}")
+        await serve(server, args.host, args.port)
+    elif args.input_file and args.workers > 1:
+        run_config = make_run_config(args.question_timeout)
+        counts = await asyncio.to_thread(
+            run_sharded, args.config, read_questions(args.input_file), args.output_file,
+            args.workers, args.concurrency, run_config,
+            checkpoint_db=args.checkpoint_db, checkpoint_every_tool_step=args.checkpoint_every_tool_step,
+        )
+        print(counts)
+    elif args.input_file:
+        counts = await batch_execution(
+            args.config, args.input_file, args.output_file, args.concurrency,
+            args.checkpoint_db, args.checkpoint_every_tool_step, args.question_timeout,
+        )
+        print(counts)
+    elif args.checkpoint_db:
+        thread_id = args.resume or args.thread_id or uuid.uuid4().hex
+        print(f"thread_id: {thread_id}")
+        try:
+            final_state = await graph_execution(
+                args.config, args.question, args.checkpoint_db, thread_id, args.checkpoint_every_tool_step,
+                args.question_timeout, resume_only=bool(args.resume),
+            )
+        except ThreadNotFound as e:
+            parser.error(f"--resume: {e} in {args.checkpoint_db}")
+        print(final_state.get("output", ""))
+    elif not args.non_streaming:
         async for event in run_streaming(args.config, args.question):
-            for node_name, node_output in event.items():
-                if node_output is not None:
-                    merged_state.update(node_output)
-            messages: list[BaseMessage] = merged_state.get("messages", [])
-            for msg in messages:
-                if hash(str(msg)) in message_ids: continue
-                print(convert_to_openai_messages(msg))
-                message_ids.add(hash(str(msg)))
-        print(merged_state["output"])
-            
+            if event["event"] == "message":
+                print(event["message"])
+            elif event["event"] == "reset":
+                for message in event["messages"]:
+                    print(message)
+            elif event["event"] == "final":
+                print(event["output"])
     else:
-        final_state = await graph_execution(args.config, args.question)
+        final_state = await graph_execution(args.config, args.question, question_timeout_s=args.question_timeout)
         print(final_state.get("output", ""))
 
 if __name__ == "__main__":
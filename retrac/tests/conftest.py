@@ -0,0 +1,114 @@
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+import pytest
+from aiohttp import web
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from retrac.config import load_config  # noqa: E402
+
+SUMMARY_MARKER = "Summary the trajectory"
+
+
+class ScriptedLLM:
+    """OpenAI-compatible chat endpoint on a background thread: every rollout answers at once, summaries follow the summary layout.
+
+    `fail(request_number, is_summary)` may return an HTTP status to fail that request with,
+    and `delay_s(request_number, is_summary)` seconds to wait before answering.
+    """
+
+    def __init__(self) -> None:
+        self.requests: List[Dict[str, Any]] = []
+        self.fail: Callable[[int, bool], int | None] = lambda n, summary: None
+        self.delay_s: Callable[[int, bool], float] = lambda n, summary: 0.0
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{self.port}/v1"
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def summaries(self) -> int:
+        return sum(r["summary"] for r in self.requests)
+
+    async def wait_for_requests(self, count: int, timeout_s: float = 30) -> None:
+        deadline = time.monotonic() + timeout_s
+        while len(self.requests) < count:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{len(self.requests)} requests received, expected {count}")
+            await asyncio.sleep(0.01)
+
+    async def _chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        last_user = [m for m in body["messages"] if m["role"] == "user"][-1]
+        summary = SUMMARY_MARKER in str(last_user["content"])
+        n = len(self.requests)
+        self.requests.append({"summary": summary, "messages": body["messages"]})
+        await asyncio.sleep(self.delay_s(n, summary))
+        status = self.fail(n, summary)
+        if status:
+            return web.json_response({"error": {"message": "scripted failure"}}, status=status)
+        content = (
+            f"0) Current Answer\n  - Paris\n1) Facts & Evidence Collected\n  - summary {n}\n"
+            if summary else f"The answer is Paris. ({n})"
+        )
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        })
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._chat)
+        runner = web.AppRunner(app, access_log=None, shutdown_timeout=0.1)
+        self._loop.run_until_complete(runner.setup())
+        self._loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", self.port).start())
+        self._started.set()
+        self._loop.run_forever()
+        # requests still held by delay_s
+        pending = asyncio.all_tasks(self._loop)
+        for task in pending:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self._loop.run_until_complete(runner.cleanup())
+        self._loop.close()
+
+    def start(self) -> "ScriptedLLM":
+        self._thread.start()
+        self._started.wait(10)
+        return self
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+
+
+@pytest.fixture
+def llm():
+    server = ScriptedLLM().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def graph_config(llm):
+    """deep_research.yaml pointed at the scripted endpoint, without tools"""
+    def make(**overrides: Any) -> Dict[str, Any]:
+        cfg = load_config(os.path.join(ROOT, "retrac", "deep_research.yaml"))
+        cfg["model"].update({"base_url": llm.base_url, "api_key": "EMPTY", "tools": [], "enable_qps_limit": False})
+        cfg.update(overrides)
+        return cfg
+    return make
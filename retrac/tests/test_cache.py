@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from retrac.cache import SingleFlight, SQLiteToolCache, set_tool_cache
+from retrac.resilience import DeadlineExceeded, deadline_scope, remaining_time
+from retrac.tools import _cached
+from retrac.tracing import question_trace
+
+
+def test_joined_flight_keeps_each_callers_deadline():
+    flight = SingleFlight()
+    budgets = []
+
+    async def fetch():
+        budgets.append(remaining_time())
+        await asyncio.sleep(0.3)
+        return "page"
+
+    async def short():
+        with deadline_scope(0.1):
+            return await flight.do("visit", "https://example.com", fetch)
+
+    async def run():
+        first = asyncio.create_task(short())
+        await asyncio.sleep(0.01)
+        joined = await flight.do("visit", "https://example.com", fetch)
+        with pytest.raises(DeadlineExceeded):
+            await first
+        return joined
+
+    assert asyncio.run(run()) == "page"
+    # one fetch, which did not inherit the first caller's budget
+    assert budgets == [None]
+    assert flight.stats() == {"visit": {"requests": 1, "saved": 1}}
+
+
+def test_cache_hits_and_misses_are_traced(tmp_path):
+    cache = SQLiteToolCache(str(tmp_path / "tools.sqlite"))
+
+    async def run():
+        with question_trace("q") as trace:
+            for _ in range(3):
+                await _cached("search", "capital of france", lambda: asyncio.sleep(0, "Paris"))
+        return trace.rollup()["counters"]
+
+    set_tool_cache(cache)
+    try:
+        counters = asyncio.run(run())
+    finally:
+        set_tool_cache(None)
+    assert counters["tool_cache_misses"] == 1
+    assert counters["tool_cache_hits"] == 2
+    assert cache.stats() == {"search": {"hits": 2, "misses": 1}}
+
+
+def test_coalesced_calls_are_traced():
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        await asyncio.sleep(0.1)
+        return "Paris"
+
+    async def run():
+        with question_trace("q") as trace:
+            results = await asyncio.gather(*[_cached("search", "capital of italy", fetch) for _ in range(3)])
+        return results, trace.rollup()["counters"]
+
+    results, counters = asyncio.run(run())
+    assert results == ["Paris"] * 3
+    assert len(fetches) == 1
+    assert counters["single_flight_saved"] == 2
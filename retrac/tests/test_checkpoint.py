@@ -0,0 +1,88 @@
+import asyncio
+import contextlib
+
+import pytest
+from langgraph.checkpoint.memory import InMemorySaver
+
+from retrac.checkpoint import CycleCheckpointSaver, ThreadNotFound, invoke_with_resume, open_checkpointer
+from retrac.components import aclose_llm_clients
+from retrac.graph import build_graph
+
+RUN_CONFIG = {"recursion_limit": 200}
+QUESTION = "What is the capital of France?"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def checkpointer(request, tmp_path):
+    saver = CycleCheckpointSaver(InMemorySaver())
+
+    def open_saver():
+        if request.param == "memory":
+            return contextlib.nullcontext(saver)
+        return open_checkpointer(str(tmp_path / "checkpoints.sqlite"))
+    return open_saver
+
+
+@contextlib.asynccontextmanager
+async def open_app(cfg, checkpointer):
+    try:
+        async with checkpointer() as saver:
+            yield build_graph(cfg).compile(checkpointer=saver)
+    finally:
+        await aclose_llm_clients()
+
+
+@pytest.mark.parametrize("crashed_cycle", [1, 2])
+def test_resume_after_crash_in_later_cycle(llm, graph_config, checkpointer, crashed_cycle):
+    # each cycle makes two requests (rollout, summary); the run is killed during the rollout of
+    # cycle crashed_cycle (0-based), after the checkpoint of the cycle before it was saved
+    crash_at = 2 * crashed_cycle
+    llm.delay_s = lambda n, summary: 60.0 if n == crash_at and not hasattr(llm, "crashed") else 0.0
+
+    async def run():
+        async with open_app(graph_config(max_cycles=3), checkpointer) as app:
+            task = asyncio.create_task(invoke_with_resume(app, QUESTION, RUN_CONFIG, "thread-1"))
+            await llm.wait_for_requests(crash_at + 1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        llm.crashed = True
+        crashed_requests = len(llm.requests)
+        # as after a restart: a new graph with only the saved checkpoints
+        async with open_app(graph_config(max_cycles=3), checkpointer) as app:
+            state = await invoke_with_resume(app, QUESTION, RUN_CONFIG, "thread-1")
+        return crashed_requests, state
+
+    crashed_requests, state = asyncio.run(run())
+    assert crashed_requests == crash_at + 1
+    # resumed from the last completed cycle: the interrupted rollout is redone, earlier cycles are not
+    assert not llm.requests[crashed_requests]["summary"]
+    assert len(llm.requests) - crashed_requests == 2 * (3 - crashed_cycle)
+    assert state["output"] is not None
+    assert len(state["cycle_histories"]) == 3
+
+
+def test_finished_thread_is_not_rerun(llm, graph_config, checkpointer):
+    async def run():
+        async with open_app(graph_config(max_cycles=2), checkpointer) as app:
+            first = await invoke_with_resume(app, QUESTION, RUN_CONFIG, "thread-2")
+            requests = len(llm.requests)
+            second = await invoke_with_resume(app, QUESTION, RUN_CONFIG, "thread-2")
+        return first, second, requests
+
+    first, second, requests = asyncio.run(run())
+    assert second["output"] == first["output"] is not None
+    assert len(llm.requests) == requests
+
+
+def test_resume_only_rejects_unknown_thread(llm, graph_config, checkpointer):
+    async def run():
+        async with open_app(graph_config(max_cycles=1), checkpointer) as app:
+            with pytest.raises(ThreadNotFound):
+                await invoke_with_resume(app, QUESTION, RUN_CONFIG, "no-such-thread", resume_only=True)
+            await invoke_with_resume(app, QUESTION, RUN_CONFIG, "thread-3")
+            return await invoke_with_resume(app, QUESTION, RUN_CONFIG, "thread-3", resume_only=True)
+
+    asyncio.run(run())
+    # only thread-3's own run reached the LLM
+    assert len(llm.requests) == 2
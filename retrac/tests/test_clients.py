@@ -0,0 +1,55 @@
+import asyncio
+
+from retrac.components import LLMClientPool
+from retrac.config import ModelConfig
+from retrac.transport import ToolTransport
+
+
+def test_tool_transport_closes_each_loops_session():
+    transport = ToolTransport()
+    other = asyncio.new_event_loop()
+
+    async def open_session():
+        return transport.session
+
+    try:
+        first = other.run_until_complete(open_session())
+
+        async def run():
+            session = transport.session
+            await transport.aclose()
+            return session
+
+        # a second loop does not take over (or drop) the first loop's session
+        second = asyncio.run(run())
+        assert second is not first and second.closed
+        assert not first.closed
+        other.run_until_complete(transport.aclose())
+        assert first.closed
+    finally:
+        other.close()
+
+
+def test_llm_client_pool_closes_each_loops_clients():
+    pool = LLMClientPool()
+    model_cfg = ModelConfig(model_name="scripted", base_url="http://127.0.0.1:1/v1", api_key="EMPTY")
+    other = asyncio.new_event_loop()
+
+    async def http_client():
+        return pool.get(model_cfg).http_async_client
+
+    try:
+        first = other.run_until_complete(http_client())
+
+        async def run():
+            client = await http_client()
+            await pool.aclose()
+            return client
+
+        second = asyncio.run(run())
+        assert second is not first and second.is_closed
+        assert not first.is_closed
+        other.run_until_complete(pool.aclose())
+        assert first.is_closed
+    finally:
+        other.close()
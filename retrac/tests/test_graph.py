@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+import pytest
+
+from retrac.checkpoint import invoke_with_resume
+from retrac.components import aclose_llm_clients
+from retrac.graph import build_graph
+
+RUN_CONFIG = {"recursion_limit": 200}
+QUESTION = "What is the capital of France?"
+
+
+def run_question(cfg, run_config=RUN_CONFIG):
+    async def run():
+        try:
+            return await invoke_with_resume(build_graph(cfg).compile(), QUESTION, run_config)
+        finally:
+            await aclose_llm_clients()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("max_cycles", [1, 3])
+@pytest.mark.parametrize("convergence", [False, True])
+def test_failed_summary_does_not_end_the_question(llm, graph_config, max_cycles, convergence):
+    # every summary request fails (400 is not retried)
+    llm.fail = lambda n, summary: 400 if summary else None
+    state = run_question(graph_config(max_cycles=max_cycles, convergence={"enabled": convergence}))
+
+    assert state["output"] is not None
+    assert state["cycle_histories"] == [[None]] * max_cycles
+    assert state["process_details"]["stop_reason"] == f"reached max_cycles ({max_cycles})"
+    assert ("current_answers" in state["process_details"]) == convergence
+
+
+@pytest.mark.parametrize("convergence", [False, True])
+def test_deadline_expiring_during_summary_stops_the_question(llm, graph_config, convergence):
+    # the first summary outlives the question's time budget
+    llm.delay_s = lambda n, summary: 10.0 if summary else 0.0
+    run_config = {**RUN_CONFIG, "configurable": {"question_timeout_s": 1.5}}
+    started = time.monotonic()
+    state = run_question(graph_config(max_cycles=3, convergence={"enabled": convergence}), run_config)
+
+    assert time.monotonic() - started < 5
+    assert state["output"] is not None
+    assert state["cycle_histories"] == [[None]]
+    assert state["process_details"]["stop_reason"] == "question time budget exhausted"
+    assert llm.summaries == 1
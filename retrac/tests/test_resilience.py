@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from retrac.checkpoint import invoke_with_resume
+from retrac.components import aclose_llm_clients
+from retrac.graph import build_graph
+from retrac.resilience import DeadlineExceeded, deadline_scope, get_circuit_breaker, retry_call
+
+RUN_CONFIG = {"recursion_limit": 200}
+QUESTION = "What is the capital of France?"
+
+
+def half_open(endpoint):
+    """The endpoint's breaker, opened long enough ago that the next request is its probe"""
+    breaker = get_circuit_breaker(endpoint)
+    breaker._opened_at = time.monotonic() - breaker.reset_s
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_deadline_during_probe_releases_the_probe():
+    breaker = half_open("http://probe.invalid/retry_call")
+
+    async def slow():
+        await asyncio.sleep(5)
+
+    async def run():
+        with deadline_scope(0.1), pytest.raises(DeadlineExceeded):
+            await retry_call(breaker.endpoint, slow)
+
+    asyncio.run(run())
+    # no verdict on the endpoint: still half-open, and the next request may probe it
+    assert breaker.state == "half_open"
+    breaker.before()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_llm_deadline_during_probe_does_not_block_later_questions(llm, graph_config):
+    breaker = half_open(llm.base_url)
+    llm.delay_s = lambda n, summary: 5.0 if n == 0 else 0.0
+    app = build_graph(graph_config(max_cycles=1)).compile()
+
+    async def run():
+        try:
+            timed_out = await invoke_with_resume(app, QUESTION, {**RUN_CONFIG, "configurable": {"question_timeout_s": 0.5}})
+            later = await invoke_with_resume(app, QUESTION, RUN_CONFIG)
+            return timed_out, later
+        finally:
+            await aclose_llm_clients()
+
+    timed_out, later = asyncio.run(run())
+    assert any("deadline" in e for e in timed_out["error"])
+    assert not any("circuit open" in e for e in later.get("error", []))
+    assert later["output"] is not None
+    assert breaker.state == "closed"